@@ -1,11 +1,12 @@
 from dataclasses import dataclass, field
-import time, importlib, inspect, os, json
-from typing import Any, Optional, Dict
-from python.helpers import extract_tools, rate_limiter, files, errors
+import asyncio, contextlib, time, json, uuid
+from typing import Any, Optional, Dict, Callable
+from python.helpers import extract_tools, rate_limiter, files, errors, tokens, checkpoint, response_cache, trace, metrics
+from python.helpers.tool_registry import tools as tool_registry
 from python.helpers.print_style import PrintStyle
+from python.helpers.prompt_assembler import PromptAssembler
 from langchain.schema import AIMessage
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.language_models.llms import BaseLLM
 from langchain_core.embeddings import Embeddings
@@ -18,13 +19,26 @@ class AgentConfig:
     memory_subdir: str = ""
     auto_memory_count: int = 3
     auto_memory_skip: int = 2
+    auto_memory_window: int = 6
+    auto_memory_timeout: float = 1
     rate_limit_seconds: int = 60
     rate_limit_requests: int = 15
     rate_limit_input_tokens: int = 1000000
     rate_limit_output_tokens: int = 0
+    rate_limit_adaptive: bool = True
     msgs_keep_max: int = 25
     msgs_keep_start: int = 5
     msgs_keep_end: int = 10
+    msgs_hard_max: int = 40
+    msgs_rolling_summary: bool = True
+    speculative_tools: bool = True
+    stream_stop_on_tool: bool = False
+    max_parallel_tools: int = 4
+    tools_hot_reload: bool = False
+    subordinate_max_parallel: int = 3
+    subordinate_timeout_seconds: int = 600
+    checkpoints: bool = False
+    adhoc_cache_mb: float = 64
     response_timeout_seconds: int = 60
     max_tool_response_length: int = 3000
     code_exec_docker_enabled: bool = True
@@ -40,126 +54,211 @@ class AgentConfig:
     additional: Dict[str, Any] = field(default_factory=dict)
     
 
+@dataclass
+class ToolDispatch:
+    # tool started while the agent message was still streaming
+    tool_name: str
+    tool_args: dict
+    tool: Any
+    task: asyncio.Task
+
+    def matches(self, tool_name: str, tool_args: dict) -> bool:
+        return self.tool_name == tool_name and self.tool_args == tool_args
+
+    def discard(self):
+        if not self.task.done(): self.task.cancel() # a tool running in a worker thread finishes there, its result is ignored
+        elif not self.task.cancelled(): self.task.exception() # mark a possible error as retrieved
+
+
+class AgentContext:
+    # state of one conversation, shared by the agent tree serving it
+    def __init__(self, id: str = "", work_dir: str = ""):
+        self.id = id or str(uuid.uuid4())
+        self.work_dir = work_dir or files.get_abs_path("./work_dir") # cwd of local shells
+        self.paused = False
+        self.streaming_agent: "Agent | None" = None
+        self.listeners: list[Callable[[dict], None]] = [] # receive streamed output, e.g. API clients
+        self.checkpoint: checkpoint.Checkpoint | None = None # state of the agent tree persisted for resume
+
+    def emit(self, type: str, agent: "Agent", content: str):
+        event = {"type": type, "agent": agent.agent_name, "content": content}
+        for listener in self.listeners: listener(event)
+
+
 class Agent:
 
-    paused=False
-    streaming_agent=None
-    
-    def __init__(self, number:int, config: AgentConfig):
+    def __init__(self, number:int, config: AgentConfig, context: AgentContext | None = None, name: str = ""):
 
         # agent config  
         self.config = config       
+        self.context = context or AgentContext() # pause, intervention and working directory of this conversation
 
         # non-config vars
         self.number = number
-        self.agent_name = f"Agent {self.number}"
+        self.agent_name = name or f"Agent {self.number}" # number is the depth in the hierarchy, names tell pooled subordinates apart
 
         self.system_prompt = files.read_file("./prompts/agent.system.md", agent_name=self.agent_name)
         self.tools_prompt = files.read_file("./prompts/agent.tools.md")
+        self.chat_tokenizer = tokens.get_tokenizer(self.config.chat_model)
+        self.utility_tokenizer = tokens.get_tokenizer(self.config.utility_model)
+        self.prompt = PromptAssembler(self.system_prompt + "\n\n" + self.tools_prompt, self.chat_tokenizer) # static system prefix is assembled once
 
         self.history = []
+        self.history_tokens = tokens.TokenLedger(self.chat_tokenizer) # token count of each message in history, kept up to date incrementally
+        self.compaction: asyncio.Task | None = None # background history summarization job
+        self.history_summary: dict = {} # running summary of messages removed from history
+        self.summary_message: BaseMessage | None = None # history message holding the running summary
+        self.memory_ids: list[str] | None = None # memories found by the last recall
+        self.memories = "" # cleaned up memories of the last recall
+        self.memory_prefetch: asyncio.Task | None = None # recall for the next prompt, runs while tools execute
         self.last_message = ""
         self.intervention_message = ""
         self.intervention_status = False
-        self.rate_limiter = rate_limiter.RateLimiter(max_calls=self.config.rate_limit_requests,max_input_tokens=self.config.rate_limit_input_tokens,max_output_tokens=self.config.rate_limit_output_tokens,window_seconds=self.config.rate_limit_seconds)
+        limits = dict(max_calls=self.config.rate_limit_requests,max_input_tokens=self.config.rate_limit_input_tokens,max_output_tokens=self.config.rate_limit_output_tokens,window_seconds=self.config.rate_limit_seconds,adaptive=self.config.rate_limit_adaptive)
+        self.rate_limiter = rate_limiter.get_limiter(self.config.chat_model, **limits) # shared by all agents using the same provider key
+        self.utility_rate_limiter = rate_limiter.get_limiter(self.config.utility_model, **limits)
         self.data = {} # free data object all the tools can use
 
-        os.chdir(files.get_abs_path("./work_dir")) #change CWD to work_dir
+        if self.config.checkpoints and not self.context.checkpoint: self.context.checkpoint = checkpoint.Checkpoint(self.context.id)
+        self.checkpoint_index = self.context.checkpoint.register(self) if self.context.checkpoint else -1
         
 
     def message_loop(self, msg: str):
+        return asyncio.run(self.amessage_loop(msg)) # sync wrapper for callers outside of an event loop
+
+    async def amessage_loop(self, msg: str):
+        with trace.span("message_loop", self, message_bytes=trace.text_bytes(msg)):
+            return await self._amessage_loop(msg)
+
+    async def _amessage_loop(self, msg: str):
         try:
             printer = PrintStyle(italic=True, font_color="#b3ffd9", padding=False)    
+            self.tool_semaphore = asyncio.Semaphore(max(1, self.config.max_parallel_tools)) # bound for tool calls running at once
+            self.tool_lock = asyncio.Lock() # tools sharing agent state run one at a time
             user_message = files.read_file("./prompts/fw.user_message.md", message=msg)
             self.append_message(user_message, human=True) # Append the user's input to the history                        
-            memories = self.fetch_memories(True)
+            self.start_memory_prefetch(reset_skip=True) # first recall starts right away, joined by the first prompt
                 
             while True: # let the agent iterate on his thoughts until he stops by using a tool
-                Agent.streaming_agent = self #mark self as current streamer
+                if not self.get_data("pooled"): self.context.streaming_agent = self #mark self as current streamer, interventions during a fan out go to the superior
                 agent_response = ""
+                received = "" # everything generated and billed, the response may be trimmed to its JSON
                 self.intervention_status = False # reset interventon status
+                tool_stream = extract_tools.ToolRequestStream() if self.config.speculative_tools or self.config.stream_stop_on_tool else None
+                dispatches: list[ToolDispatch] = []
 
                 try:
 
-                    system = self.system_prompt + "\n\n" + self.tools_prompt
-                    memories = self.fetch_memories()
-                    if memories: system+= "\n\n"+memories
+                    await self.acompact_history()
 
-                    prompt = ChatPromptTemplate.from_messages([
-                        SystemMessage(content=system),
-                        MessagesPlaceholder(variable_name="messages") ])
-                    
-                    inputs = {"messages": self.history}
-                    chain = prompt | self.config.chat_model
+                    memories = await self.ajoin_memories()
+                    self.prompt.set_system_extra(memories)
+                    inputs = self.prompt.assemble(self.history)
 
-                    formatted_inputs = prompt.format(messages=self.history)
-                    tokens = int(len(formatted_inputs)/4)     
-                    self.rate_limiter.limit_call_and_input(tokens)
+                    input_tokens = self.prompt.system_tokens + self.history_tokens.total
+                    call_record = await self.rate_limiter.alimit_call_and_input(input_tokens)
                     
                     # output that the agent is starting
                     PrintStyle(bold=True, font_color="green", padding=True, background_color="white").print(f"{self.agent_name}: Starting a message:")
                                             
-                    for chunk in chain.stream(inputs):
-                        if self.handle_intervention(agent_response): break # wait for intervention and handle it, if paused
-
-                        if isinstance(chunk, str): content = chunk
-                        elif hasattr(chunk, "content"): content = str(chunk.content)
-                        else: content = str(chunk)
+                    with trace.span("llm_call", self, input_tokens=input_tokens, input_messages=len(inputs)) as span:
+                        span["input_bytes"] = trace.text_bytes(*(message.content for message in inputs))
+                        llm_start = time.time()
+                        async with contextlib.aclosing(self.config.chat_model.astream(inputs)) as stream: # closing the stream cancels generation
+                            async for chunk in stream:
+                                if await self.ahandle_intervention(agent_response): break # wait for intervention and handle it, if paused
+
+                                if isinstance(chunk, str): content = chunk
+                                elif hasattr(chunk, "content"): content = str(chunk.content)
+                                else: content = str(chunk)
                         
-                        if content:
-                            printer.stream(content) # output the agent response stream                
-                            agent_response += content # concatenate stream into the response
-
-                    self.rate_limiter.set_output_tokens(int(len(agent_response)/4))
+                                if content:
+                                    if "ttft" not in span: span["ttft"] = round(time.time() - llm_start, 6)
+                                    printer.stream(content) # output the agent response stream                
+                                    self.context.emit("stream", self, content)
+                                    agent_response += content # concatenate stream into the response
+                                    received += content
+
+                                    if tool_stream and not tool_stream.closed:
+                                        ready = len(tool_stream.tool_requests)
+                                        tool_requests = tool_stream.feed(content)
+                                        # start tools as soon as their requests are complete, the rest of the stream is usually filler
+                                        if self.config.speculative_tools:
+                                            for i in range(ready, len(tool_requests)):
+                                                if dispatch := self.dispatch_tool(tool_requests[i], agent_response): dispatches.append(dispatch)
+                                        # stop generating once the tool request object is closed, only keep the JSON
+                                        if tool_requests and tool_stream.closed and self.config.stream_stop_on_tool:
+                                            agent_response = self.stop_stream(agent_response, tool_stream)
+                                            break
+
+                        output_tokens = self.chat_tokenizer(received)
+                        span.update(output_tokens=output_tokens, output_bytes=trace.text_bytes(received))
+                    self.rate_limiter.set_output_tokens(output_tokens, call_record)
                     
-                    if not self.handle_intervention(agent_response):
+                    if not await self.ahandle_intervention(agent_response):
                         if self.last_message == agent_response: #if assistant_response is the same as last message in history, let him know
                             self.append_message(agent_response) # Append the assistant's response to the history
                             warning_msg = files.read_file("./prompts/fw.msg_repeat.md")
                             self.append_message(warning_msg, human=True) # Append warning message to the history
+                            metrics.inc("agent_repeated_responses_total")
                             PrintStyle(font_color="orange", padding=True).print(warning_msg)
 
                         else: #otherwise proceed with tool
                             self.append_message(agent_response) # Append the assistant's response to the history
-                            tools_result = self.process_tools(agent_response) # process tools requested in agent message
+                            tools_result = await self.aprocess_tools(agent_response, dispatches) # process tools requested in agent message
                             if tools_result: return tools_result #break the execution if the task is done
 
                 # Forward errors to the LLM, maybe he can fix them
                 except Exception as e:
+                    metrics.inc("agent_errors_total", type(e).__name__)
                     error_message = errors.format_error(e)
                     msg_response = files.read_file("./prompts/fw.error.md", error=error_message) # error message template
                     self.append_message(msg_response, human=True)
                     PrintStyle(font_color="red", padding=True).print(msg_response)
+
+                finally:
+                    for dispatch in dispatches: dispatch.discard() # not used due to intervention, repeat or error
                     
         finally:
-            Agent.streaming_agent = None # unset current streamer
+            if not self.get_data("pooled"): self.context.streaming_agent = self.get_data("superior") # unset current streamer, a subordinate hands it back to its superior
+
+    def close_shells(self):
+        # shells of this agent and its whole subordinate tree, delegated and fanned out
+        agents = [self]
+        while agents:
+            agent = agents.pop()
+            state = agent.get_data("cot_state")
+            if state: state.shell.close()
+            agents += [sub for sub in [agent.get_data("subordinate"), *(agent.get_data("subordinates") or [])] if sub]
 
     def get_data(self, field:str):
         return self.data.get(field, None)
 
     def set_data(self, field:str, value):
         self.data[field] = value
+        if self.context.checkpoint: self.context.checkpoint.set_data(self, field, value)
 
     def append_message(self, msg: str, human: bool = False):
         message_type = "human" if human else "ai"
         if self.history and self.history[-1].type == message_type:
             self.history[-1].content += "\n\n" + msg
+            self.history_tokens.extend(self.history[-1], "\n\n" + msg)
         else:
             new_message = HumanMessage(content=msg) if human else AIMessage(content=msg)
-            self.history.append(new_message)
-            self.cleanup_history(self.config.msgs_keep_max, self.config.msgs_keep_start, self.config.msgs_keep_end)
+            self.history.append(new_message) # history cleanup runs in the message loop before the next LLM call
+            self.history_tokens.add(new_message)
         if message_type=="ai":
             self.last_message = msg
+        if self.context.checkpoint: self.context.checkpoint.append(self, msg, human)
 
     def concat_messages(self,messages):
         return "\n".join([f"{msg.type}: {msg.content}" for msg in messages])
 
     def send_adhoc_message(self, system: str, msg: str, output_label:str):
-        prompt = ChatPromptTemplate.from_messages([
-            SystemMessage(content=system),
-            HumanMessage(content=msg)])
+        return asyncio.run(self.asend_adhoc_message(system, msg, output_label)) # sync wrapper for callers outside of an event loop
 
-        chain = prompt | self.config.utility_model
+    async def asend_adhoc_message(self, system: str, msg: str, output_label:str, background=False):
+        inputs = [SystemMessage(content=system), HumanMessage(content=msg)]
         response = ""
         printer = None
 
@@ -167,21 +266,39 @@ class Agent:
             PrintStyle(bold=True, font_color="orange", padding=True, background_color="white").print(f"{self.agent_name}: {output_label}:")
             printer = PrintStyle(italic=True, font_color="orange", padding=False)                
 
-        formatted_inputs = prompt.format()
-        tokens = int(len(formatted_inputs)/4)     
-        self.rate_limiter.limit_call_and_input(tokens)
+        # deterministic calls are answered from the persistent cache, e.g. the same summary after a restart
+        cache = response_cache.get_cache(self.config.adhoc_cache_mb) if self.config.adhoc_cache_mb > 0 and response_cache.is_deterministic(self.config.utility_model) else None
+        cache_key = response_cache.get_key(self.config.utility_model, system, msg) if cache else ""
+        if cache and (cached := await asyncio.to_thread(cache.get, cache_key)) is not None:
+            PrintStyle(font_color="gray", padding=False).print(f"{self.agent_name}: Utility response loaded from cache")
+            if printer: printer.print(cached)
+            trace.event("utility_call", self, label=output_label, background=background, cached=True, output_bytes=trace.text_bytes(cached))
+            return cached
+
+        input_tokens = self.utility_tokenizer(system) + self.utility_tokenizer(msg)
+        call_record = await self.utility_rate_limiter.alimit_call_and_input(input_tokens)
     
-        for chunk in chain.stream({}):
-            if self.handle_intervention(): break # wait for intervention and handle it, if paused
-
-            if isinstance(chunk, str): content = chunk
-            elif hasattr(chunk, "content"): content = str(chunk.content)
-            else: content = str(chunk)
-
-            if printer: printer.stream(content)
-            response+=content
-
-        self.rate_limiter.set_output_tokens(int(len(response)/4))
+        with trace.span("utility_call", self, label=output_label, background=background, cached=False, input_tokens=input_tokens, input_bytes=trace.text_bytes(system, msg)) as span:
+            llm_start = time.time()
+            async for chunk in self.config.utility_model.astream(inputs):
+                if background:
+                    while self.context.paused: await asyncio.sleep(0.1) # only wait if paused, interventions belong to the message loop
+                elif await self.ahandle_intervention():
+                    cache = None # incomplete response
+                    break # wait for intervention and handle it, if paused
+
+                if isinstance(chunk, str): content = chunk
+                elif hasattr(chunk, "content"): content = str(chunk.content)
+                else: content = str(chunk)
+
+                if content and "ttft" not in span: span["ttft"] = round(time.time() - llm_start, 6)
+                if printer: printer.stream(content)
+                response+=content
+
+            output_tokens = self.utility_tokenizer(response)
+            span.update(output_tokens=output_tokens, output_bytes=trace.text_bytes(response))
+        self.utility_rate_limiter.set_output_tokens(output_tokens, call_record)
+        if cache and response: await asyncio.to_thread(cache.set, cache_key, response)
 
         return response
             
@@ -189,40 +306,130 @@ class Agent:
         if self.history:
             return self.history[-1]
 
-    def replace_middle_messages(self,middle_messages):
-        cleanup_prompt = files.read_file("./prompts/fw.msg_cleanup.md")
-        summary = self.send_adhoc_message(system=cleanup_prompt,msg=self.concat_messages(middle_messages), output_label="Mid messages cleanup summary")
-        new_human_message = HumanMessage(content=summary)
-        return [new_human_message]
-
-    def cleanup_history(self, max:int, keep_start:int, keep_end:int):
-        if len(self.history) <= max:
-            return self.history
-
-        first_x = self.history[:keep_start]
-        last_y = self.history[-keep_end:]
+    async def areplace_middle_messages(self,middle_messages, background=False):
+        output_label = "" if background else "Mid messages cleanup summary" # background jobs do not stream into the console
+        with trace.span("history_compaction", self, background=background, messages=len(middle_messages)) as span:
+            span["input_bytes"] = trace.text_bytes(*(msg.content for msg in middle_messages))
+            if self.config.msgs_rolling_summary:
+                summary = await self.aupdate_summary(middle_messages, output_label, background)
+                new_human_message = HumanMessage(content=json.dumps(summary, indent=4))
+            else:
+                cleanup_prompt = files.read_file("./prompts/fw.msg_cleanup.md")
+                summary = await self.asend_adhoc_message(system=cleanup_prompt,msg=self.concat_messages(middle_messages), output_label=output_label, background=background)
+                new_human_message = HumanMessage(content=summary)
+            span["output_bytes"] = trace.text_bytes(new_human_message.content)
+            return [new_human_message]
+
+    async def aupdate_summary(self, middle_messages, output_label:str, background=False) -> dict:
+        # only newly evicted messages are sent along with the current summary, never the summary message itself
+        current = self.history_summary if any(msg is self.summary_message for msg in middle_messages) else {}
+        new_messages = [msg for msg in middle_messages if msg is not self.summary_message]
+        input = {
+            "current_summary": current,
+            "new_messages": self.concat_messages(new_messages)
+        }
+        update_prompt = files.read_file("./prompts/fw.msg_summary_update.md")
+        response = await self.asend_adhoc_message(update_prompt, json.dumps(input), output_label=output_label, background=background)
+        summary = extract_tools.json_parse_dirty(response)
+        if not summary or not isinstance(summary.get("messages_summary"), list): # keep the structure even if the model did not
+            summary = {
+                "system_info": "Messages have been summarized to save space.",
+                "messages_summary": current.get("messages_summary", []) + [response.strip()]
+            }
+        return summary
 
+    def get_cleanup_range(self, keep_start:int, keep_end:int) -> tuple[int, int]:
         # Identify the middle part
-        middle_part = self.history[keep_start:-keep_end]
+        start, end = keep_start, len(self.history) - keep_end
 
         # Ensure the first message in the middle is "human", if not, move one message back
-        if middle_part and middle_part[0].type != "human":
-            if len(first_x) > 0:
-                middle_part.insert(0, first_x.pop())
+        if start < end and self.history[start].type != "human" and start > 0:
+            start -= 1
 
         # Ensure the middle part has an odd number of messages
-        if len(middle_part) % 2 == 0:
-            middle_part = middle_part[:-1]
+        if (end - start) % 2 == 0:
+            end -= 1
+
+        return start, end
+
+    def splice_history(self, start:int, middle_part:list, contents:list, new_middle_part:list) -> bool:
+        # only replace the middle part if it is still in place and unchanged
+        current = self.history[start:start+len(middle_part)]
+        if len(current) != len(middle_part) or any(cur is not msg or cur.content != content for cur, msg, content in zip(current, middle_part, contents)):
+            return False
+        self.history = self.history[:start] + new_middle_part + self.history[start+len(middle_part):]
+        self.history_tokens.sync(self.history)
+        if self.config.msgs_rolling_summary and new_middle_part:
+            self.summary_message = new_middle_part[0]
+            self.history_summary = json.loads(str(self.summary_message.content))
+        if self.context.checkpoint: self.context.checkpoint.replace_history(self)
+        return True
+
+    async def acleanup_history(self, max:int, keep_start:int, keep_end:int):
+        if len(self.history) <= max:
+            return self.history
 
-        # Replace the middle part using the replacement function
-        new_middle_part = self.replace_middle_messages(middle_part)
+        start, end = self.get_cleanup_range(keep_start, keep_end)
+        middle_part = self.history[start:end]
 
-        self.history = first_x + new_middle_part + last_y
+        # Replace the middle part using the replacement function
+        new_middle_part = await self.areplace_middle_messages(middle_part)
+        self.splice_history(start, middle_part, [msg.content for msg in middle_part], new_middle_part)
 
         return self.history
 
+    def start_history_compaction(self):
+        if self.compaction: return # one job at a time, a finished one waits to be applied
+        if len(self.history) <= self.config.msgs_keep_max: return # below the soft threshold
+
+        start, end = self.get_cleanup_range(self.config.msgs_keep_start, self.config.msgs_keep_end)
+        middle_part = self.history[start:end]
+        if not middle_part: return
+        contents = [msg.content for msg in middle_part] # snapshot to detect changes before splicing
+
+        async def compact():
+            return start, middle_part, contents, await self.areplace_middle_messages(middle_part, background=True)
+        self.compaction = asyncio.create_task(compact())
+
+    def apply_history_compaction(self) -> bool:
+        task = self.compaction
+        if not task or not task.done(): return False
+        self.compaction = None
+        if task.cancelled(): return False # cancelled together with the event loop of a previous message loop
+        if task.exception():
+            PrintStyle(font_color="red", padding=True).print(f"{self.agent_name}: Background history compaction failed: {task.exception()}")
+            return False
+        start, middle_part, contents, new_middle_part = task.result()
+        return self.splice_history(start, middle_part, contents, new_middle_part)
+
+    async def acompact_history(self):
+        # splice a finished background summary, start a new one over the soft limit and only block over the hard limit
+        self.apply_history_compaction()
+        if len(self.history) > self.config.msgs_hard_max:
+            if self.compaction:
+                await asyncio.wait([self.compaction])
+                self.apply_history_compaction()
+            await self.acleanup_history(self.config.msgs_keep_max, self.config.msgs_keep_start, self.config.msgs_keep_end)
+        self.start_history_compaction()
+
     def handle_intervention(self, progress:str="") -> bool:
-        while self.paused: time.sleep(0.1) # wait if paused
+        while self.context.paused: time.sleep(0.1) # wait if paused
+        return self._process_intervention(progress)
+
+    async def ahandle_intervention(self, progress:str="") -> bool:
+        while self.context.paused: await asyncio.sleep(0.1) # wait if paused, without blocking the event loop
+        return self._process_intervention(progress)
+
+    def wait_if_paused(self) -> bool:
+        # for tools, also in worker threads and speculative runs: waits, but leaves the intervention to the message loop
+        while self.context.paused: time.sleep(0.1)
+        return bool(self.intervention_message) or self.intervention_status
+
+    async def await_if_paused(self) -> bool:
+        while self.context.paused: await asyncio.sleep(0.1)
+        return bool(self.intervention_message) or self.intervention_status
+
+    def _process_intervention(self, progress:str="") -> bool:
         if self.intervention_message and not self.intervention_status: # if there is an intervention message, but not yet processed
             if progress.strip(): self.append_message(progress) # append the response generated so far
             user_msg = files.read_file("./prompts/fw.intervention.md", user_message=self.intervention_message) # format the user intervention template
@@ -231,50 +438,105 @@ class Agent:
             self.intervention_status = True
         return self.intervention_status # return intervention status
 
-    def process_tools(self, msg: str):
-        # search for tool usage requests in agent message
-        tool_request = extract_tools.json_parse_dirty(msg)
-
-        if tool_request is not None:
-            tool_name = tool_request.get("tool_name", "")
-            tool_args = tool_request.get("tool_args", {})
-
-            tool = self.get_tool(
-                        tool_name,
-                        tool_args,
-                        msg)
+    def stop_stream(self, agent_response: str, tool_stream: extract_tools.ToolRequestStream) -> str:
+        json_response = agent_response[tool_stream.start:tool_stream.end]
+        trimmed_tokens = self.chat_tokenizer(agent_response[:tool_stream.start] + agent_response[tool_stream.end:])
+        PrintStyle(font_color="gray", padding=True).print(f"{self.agent_name}: Stream stopped after tool request, {trimmed_tokens} tokens around the JSON trimmed from history, remaining generation cancelled.")
+        return json_response
+
+    def dispatch_tool(self, tool_request: dict, message: str) -> ToolDispatch | None:
+        tool_name = tool_request["tool_name"]
+        tool_args = tool_request["tool_args"]
+        if not tool_registry.has(tool_name): return None # unknown tools are only reported once the message is complete
+        tool = self.get_tool(tool_name, tool_args, message)
+        if not tool.speculative or tool.side_effects: return None # the message may still be rejected (repeat, intervention), a discarded run cannot be undone
+        return ToolDispatch(tool_name, tool_args, tool, asyncio.create_task(self.aexecute_tool(tool, tool_args)))
+
+    async def aexecute_tool(self, tool, tool_args: dict):
+        with trace.span("tool_execute", self, tool=tool.name, args_bytes=trace.text_bytes(*tool_args.values())) as span:
+            if tool.parallel:
+                async with self.tool_semaphore:
+                    response = await tool.aexecute(**tool_args)
+            else:
+                async with self.tool_lock, self.tool_semaphore: # shared state like the shell session allows one call at a time
+                    response = await tool.aexecute(**tool_args)
+            span["output_bytes"] = trace.text_bytes(response.message)
+            return response
+
+    async def aprocess_tools(self, msg: str, dispatches: list[ToolDispatch] | None = None):
+        # search for tool usage requests in agent message, either a single tool or a list of tool calls
+        tool_requests = extract_tools.get_tool_requests(extract_tools.json_parse_dirty(msg))
+
+        if tool_requests:
+            # reuse tools already running since the stream, resolve the rest
+            pending = list(dispatches or [])
+            calls = []
+            for tool_request in tool_requests:
+                tool_name = tool_request["tool_name"]
+                tool_args = tool_request["tool_args"]
+                dispatch = next((d for d in pending if d.matches(tool_name, tool_args)), None)
+                if dispatch:
+                    pending.remove(dispatch)
+                    dispatch.tool.message = msg
+                    calls.append((dispatch.tool, tool_args, dispatch.task))
+                else:
+                    calls.append((self.get_tool(tool_name, tool_args, msg), tool_args, None))
+            for dispatch in pending: dispatch.discard()
+            if not any(tool.final for tool, _, _ in calls): self.start_background_work() # the final response needs no next prompt
                 
-            if self.handle_intervention(): return # wait if paused and handle intervention message if needed
-            tool.before_execution(**tool_args)
-            if self.handle_intervention(): return # wait if paused and handle intervention message if needed
-            response = tool.execute(**tool_args)
-            if self.handle_intervention(): return # wait if paused and handle intervention message if needed
-            tool.after_execution(response)
-            if self.handle_intervention(): return # wait if paused and handle intervention message if needed
-            if response.break_loop: return response.message
+            for tool, tool_args, _ in calls:
+                if await self.ahandle_intervention(): return # wait if paused and handle intervention message if needed
+                with trace.span("tool_before", self, tool=tool.name): tool.before_execution(**tool_args) # output in request order
+            if await self.ahandle_intervention(): return # wait if paused and handle intervention message if needed
+            responses = await asyncio.gather(*[task or self.aexecute_tool(tool, tool_args) for tool, tool_args, task in calls], return_exceptions=True)
+            if await self.ahandle_intervention(): return # wait if paused and handle intervention message if needed
+            for (tool, _, _), response in zip(calls, responses):
+                if isinstance(response, BaseException): continue
+                if await self.ahandle_intervention(): return # wait if paused, an intervention drops the remaining tool responses
+                with trace.span("tool_after", self, tool=tool.name): tool.after_execution(response) # responses merge into one message in request order
+            for response in responses:
+                if isinstance(response, BaseException): raise response # forward the first error to the LLM
+            if await self.ahandle_intervention(): return # wait if paused and handle intervention message if needed
+            for response in responses:
+                if response.break_loop: return response.message
         else:
             msg = files.read_file("prompts/fw.msg_misformat.md")
             self.append_message(msg, human=True)
+            self.start_background_work()
+            metrics.inc("agent_misformatted_responses_total")
             PrintStyle(font_color="red", padding=True).print(msg)
 
 
+    def start_background_work(self):
+        self.start_history_compaction() # summarize old messages while the tool runs
+        self.start_memory_prefetch() # recall memories for the next prompt while the tool runs
+
     def get_tool(self, name: str, args: dict, message: str, **kwargs):
         from python.tools.unknown import Unknown 
-        from python.helpers.tool import Tool
         
-        tool_class = Unknown
-        if files.exists("python/tools",f"{name}.py"): 
-            module = importlib.import_module("python.tools." + name)  # Import the module
-            class_list = inspect.getmembers(module, inspect.isclass)  # Get all functions in the module
-
-            for cls in class_list:
-                if cls[1] is not Tool and issubclass(cls[1], Tool):
-                    tool_class = cls[1]
-                    break
-
+        tool_class = tool_registry.get(name, hot_reload=self.config.tools_hot_reload) or Unknown
         return tool_class(agent=self, name=name, args=args, message=message, **kwargs)
 
-    def fetch_memories(self,reset_skip=False):
+    def start_memory_prefetch(self, reset_skip=False):
+        if self.memory_prefetch and not self.memory_prefetch.done(): return # previous recall still running, join that one
+        self.memory_prefetch = asyncio.create_task(self.afetch_memories(reset_skip, background=True))
+
+    async def ajoin_memories(self) -> str:
+        task, self.memory_prefetch = self.memory_prefetch, None
+        if not task: return await self.afetch_memories() # nothing prefetched (repeat or error turn)
+        if not task.done():
+            done, _ = await asyncio.wait([task], timeout=self.config.auto_memory_timeout)
+            if not done:
+                self.memory_prefetch = task # keep it running, joined on the next turn
+                PrintStyle(font_color="orange", padding=True).print(f"{self.agent_name}: Memory recall is slow, using last known memories")
+                return self.memories
+        if task.cancelled(): return self.memories # cancelled together with the event loop of a previous message loop
+        if task.exception():
+            PrintStyle(font_color="red", padding=True).print(f"{self.agent_name}: Memory recall failed: {task.exception()}")
+            return self.memories
+        return task.result()
+
+    async def afetch_memories(self,reset_skip=False,background=False):
         if self.config.auto_memory_count<=0: return ""
         if reset_skip: self.memory_skip_counter = 0
 
@@ -283,16 +545,27 @@ class Agent:
             return ""
         else:
             self.memory_skip_counter = self.config.auto_memory_skip
-            from python.tools import memory_tool
-            messages = self.concat_messages(self.history)
-            memories = memory_tool.search(self,messages)
-            input = {
-                "conversation_history" : messages,
-                "raw_memories": memories
-            }
-            cleanup_prompt = files.read_file("./prompts/msg.memory_cleanup.md").replace("{", "{{")       
-            clean_memories = self.send_adhoc_message(cleanup_prompt,json.dumps(input), output_label="Memory injection")
-            return clean_memories
+            with trace.span("memory_recall", self, background=background): # search and cleanup, what the next prompt waits for
+                from python.tools import memory_tool
+                messages = self.concat_messages(self.history[-self.config.auto_memory_window:]) # recent window is the current topic
+                with trace.span("memory_fetch", self, background=background, query_bytes=trace.text_bytes(messages)) as span:
+                    docs = await asyncio.to_thread(memory_tool.search_documents, self, messages, self.config.auto_memory_count) # vector search is blocking
+                    span.update(documents=len(docs), output_bytes=trace.text_bytes(*(doc.page_content for doc in docs)))
+                ids = [doc.metadata["id"] for doc in docs]
+
+                if ids == self.memory_ids: return self.memories # same memories as last time, reuse their cleanup
+                self.memory_ids = ids
+                if not docs:
+                    self.memories = ""
+                    return self.memories
+
+                input = {
+                    "conversation_history" : messages,
+                    "raw_memories": str(docs)
+                }
+                cleanup_prompt = files.read_file("./prompts/msg.memory_cleanup.md") # sent as a message object, no template escaping needed
+                self.memories = await self.asend_adhoc_message(cleanup_prompt,json.dumps(input), output_label="" if background else "Memory injection", background=background)
+                return self.memories
 
     def call_extension(self, name: str, **kwargs) -> Any:
         pass
\ No newline at end of file
@@ -0,0 +1,120 @@
+import asyncio, functools, hashlib, time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+from python.helpers.model_router import merge_chunks
+
+# Offline stand-ins for the model providers and the shell, so benchmarks measure the framework only.
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model streaming canned responses in order (repeating the list) at a configurable latency and token rate.
+    The simulated provider latency is summed up, so it can be subtracted from measured times."""
+
+    responses: list
+    ttft: float = 0.0 # seconds before the first chunk
+    tokens_per_second: float = 0.0 # 0 = all chunks at once
+    chars_per_token: int = 4 # chunk size
+    _index: int = PrivateAttr(default=0)
+    _latency: float = PrivateAttr(default=0.0)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    @property
+    def latency(self) -> float:
+        return self._latency
+
+    def next_chunks(self) -> list[str]:
+        text = self.responses[self._index % len(self.responses)]
+        self._index += 1
+        return [text[i:i+self.chars_per_token] for i in range(0, len(text), self.chars_per_token)]
+
+    def _sleep(self, seconds: float):
+        if seconds <= 0: return
+        start = time.perf_counter()
+        time.sleep(seconds)
+        self._latency += time.perf_counter() - start
+
+    async def _asleep(self, seconds: float):
+        if seconds <= 0: return
+        start = time.perf_counter()
+        await asyncio.sleep(seconds)
+        self._latency += time.perf_counter() - start
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        chunks = self.next_chunks()
+        self._sleep(self.ttft)
+        for chunk in chunks:
+            if self.tokens_per_second: self._sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        chunks = self.next_chunks()
+        await self._asleep(self.ttft)
+        for chunk in chunks:
+            if self.tokens_per_second: await self._asleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        return merge_chunks(list(self._stream(messages, stop, run_manager, **kwargs)))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        return merge_chunks([chunk async for chunk in self._astream(messages, stop, run_manager, **kwargs)])
+
+
+class FakeEmbeddings(Embeddings):
+    # deterministic bag of words vectors: texts sharing words are similar, so memory searches find documents like with a real model.
+    # A direction shared by all texts keeps unrelated ones at a positive similarity, real embedding spaces are not isotropic either.
+    def __init__(self, size: int = 256):
+        self.size = size
+        self.word_vector = functools.lru_cache(maxsize=100000)(self._word_vector)
+        self.common = self.normalize(self._word_vector("\0"))
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.sha256(word.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).normal(size=self.size)
+
+    def normalize(self, vector: np.ndarray) -> np.ndarray:
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed(self, text: str) -> list[float]:
+        words = self.normalize(sum((self.word_vector(word) for word in text.lower().split()), np.zeros(self.size)))
+        return self.normalize(words + self.common).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed(text)
+
+
+class FakeShell:
+    # in-process replacement for LocalInteractiveSession, every command prints its output lines at once
+    def __init__(self, output_lines: int = 20):
+        self.output_lines = output_lines
+        self.full_output = ""
+        self.pending = ""
+        self.commands: list[str] = []
+
+    def connect(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send_command(self, command: str):
+        self.commands.append(command)
+        self.full_output = ""
+        self.pending = "".join(f"{command}: output line {i}\n" for i in range(self.output_lines))
+
+    def read_output(self) -> tuple[str, str | None]:
+        partial, self.pending = self.pending or None, ""
+        if partial: self.full_output += partial
+        return self.full_output, partial
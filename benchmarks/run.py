@@ -0,0 +1,153 @@
+import argparse, contextlib, json, os, shutil, sys, tempfile, time, tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # repository root
+from agent import Agent, AgentConfig
+from python.helpers import trace
+from python.helpers.print_style import PrintStyle
+from python.tools import memory_tool
+from benchmarks.fakes import ScriptedChatModel, FakeEmbeddings, FakeShell
+
+# Offline benchmark of the agent loop: scripted models, fake embeddings and an in-process shell,
+# run at several history lengths. Reports framework overhead per turn (wall time minus simulated provider latency and tool execution),
+# time spent in history cleanup, memory recall and tools, and allocations.
+#
+#   python benchmarks/run.py --lengths 0,20,40,80 --turns 10 --json results.json
+#   python benchmarks/run.py --baseline results.json --tolerance 0.25   # exit code 1 on regression
+
+FILLER = "The quick brown fox jumps over the lazy dog while the agent keeps working on its task."
+
+
+def tool_call(turn: int, name: str, thought_words: int, **args) -> str:
+    thought = f"Turn {turn}: " + " ".join(FILLER.split() * (thought_words // 17 + 1))[:thought_words * 6] # unique, so no repeat warning
+    return json.dumps({"thoughts": [thought], "tool_name": name, "tool_args": args}, indent=4)
+
+def script_responses(script: list[str], turns: int, thought_words: int) -> list[str]:
+    responses = []
+    memory_calls = 0
+    for turn in range(turns):
+        kind = script[turn % len(script)]
+        if kind == "memory":
+            args = {"memorize": f"Benchmark fact number {turn}. {FILLER}"} if memory_calls % 2 == 0 else {"query": f"benchmark fact {turn}", "threshold": 0}
+            responses.append(tool_call(turn, "memory_tool", thought_words, **args)) # saves and searches alternate
+            memory_calls += 1
+        elif kind == "shell": responses.append(tool_call(turn, "code_execution_tool", thought_words, runtime="terminal", code=f"ls -la /tmp/{turn}"))
+        else: responses.append(tool_call(turn, "benchmark_unknown_tool", thought_words, step=turn)) # answered by the unknown tool
+    return responses + [tool_call(turns, "response", thought_words, text="Benchmark finished.")]
+
+
+def create_agent(args, memory_dir: str, history_length: int) -> Agent:
+    chat = ScriptedChatModel(responses=script_responses(args.script.split(","), args.turns, args.thought_words), ttft=args.ttft, tokens_per_second=args.tps)
+    utility = ScriptedChatModel(responses=[json.dumps({"system_info": "Messages have been summarized.", "messages_summary": [FILLER] * 3})], ttft=args.ttft, tokens_per_second=args.tps)
+    config = AgentConfig(
+        chat_model = chat,
+        utility_model = utility,
+        embeddings_model = FakeEmbeddings(args.embedding_size),
+        memory_subdir = memory_dir, # absolute, outside of the memory folder
+        rate_limit_requests = 0,
+        rate_limit_input_tokens = 0,
+        adhoc_cache_mb = 0, # every cleanup is computed
+        code_exec_docker_enabled = False,
+        code_exec_ssh_enabled = False,
+    )
+    agent = Agent(0, config)
+    from python.tools.code_execution_tool import State
+    agent.set_data("cot_state", State(shell=FakeShell(args.shell_lines), docker=None))
+
+    db = memory_tool.initialize(agent)
+    for i in range(args.memories): db.insert_document(f"Stored memory {i}. {FILLER}")
+    for i in range(history_length): agent.append_message(f"Earlier message {i}. " + FILLER * 4, human=i % 2 == 0)
+    return agent
+
+
+def run_once(args, history_length: int, allocations: bool) -> dict:
+    memory_dir = tempfile.mkdtemp(prefix="agent_benchmark_")
+    spans: list[dict] = []
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull): agent = create_agent(args, memory_dir, history_length)
+        trace.listeners.append(spans.append)
+        if allocations:
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull): agent.message_loop("Run the benchmark task.")
+        finally:
+            wall = time.perf_counter() - start
+            trace.listeners.remove(spans.append)
+            if allocations:
+                current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+        if allocations: return {"peak_kib": (peak - before) / 1024, "retained_kib": (current - before) / 1024}
+
+        latency = agent.config.chat_model.latency + agent.config.utility_model.latency
+        total = lambda name, **match: sum(span["duration"] for span in spans if span["span"] == name and all(span.get(k) == v for k, v in match.items()))
+        turns = sum(1 for span in spans if span["span"] == "llm_call")
+        tools = total("tool_execute")
+        return {
+            "history_length": history_length,
+            "turns": turns,
+            "wall_s": wall,
+            "provider_latency_s": latency,
+            "tools_s": tools, # reported per tool below, shell output collection polls until it is idle
+            "overhead_per_turn_ms": (wall - latency - tools) / max(turns, 1) * 1000,
+            "history_cleanup_s": total("history_compaction"),
+            "memory_recall_s": total("memory_recall"),
+            "memory_tool_s": total("tool_execute", tool="memory_tool"),
+            "shell_s": total("tool_execute", tool="code_execution_tool"),
+            "utility_calls": sum(1 for span in spans if span["span"] == "utility_call"),
+        }
+    finally:
+        memory_tool.dbs.pop(memory_dir, None)
+        shutil.rmtree(memory_dir, ignore_errors=True)
+
+
+def compare(results: list[dict], baseline_path: str, tolerance: float) -> list[str]:
+    with open(baseline_path) as file: baseline = {row["history_length"]: row for row in json.load(file)}
+    regressions = []
+    for row in results:
+        base = baseline.get(row["history_length"])
+        if not base: continue
+        for key in ("overhead_per_turn_ms", "peak_kib"):
+            if key in row and key in base and row[key] > base[key] * (1 + tolerance):
+                regressions.append(f"history {row['history_length']}: {key} {row[key]:.1f} > {base[key]:.1f} (+{tolerance:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline agent loop benchmark")
+    parser.add_argument("--lengths", default="0,20,40,80", help="history lengths to start from, comma separated")
+    parser.add_argument("--turns", type=int, default=10, help="tool calls per run before the final response")
+    parser.add_argument("--script", default="unknown,memory,unknown,memory,shell", help="tool call kinds repeated over the turns: unknown, memory, shell")
+    parser.add_argument("--thought-words", type=int, default=60, help="length of the thoughts in each response")
+    parser.add_argument("--ttft", type=float, default=0.0, help="simulated seconds to the first token")
+    parser.add_argument("--tps", type=float, default=0.0, help="simulated tokens per second, 0 = instant")
+    parser.add_argument("--memories", type=int, default=50, help="documents stored before each run")
+    parser.add_argument("--embedding-size", type=int, default=256)
+    parser.add_argument("--shell-lines", type=int, default=20, help="output lines per fake shell command")
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs per length, the fastest is reported")
+    parser.add_argument("--no-allocations", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file to compare against, exit code 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    PrintStyle.log_enabled = False # no html log files, console output goes to devnull
+    results = []
+    for length in [int(length) for length in args.lengths.split(",")]:
+        row = min((run_once(args, length, False) for _ in range(max(1, args.repeat))), key=lambda row: row["overhead_per_turn_ms"])
+        if not args.no_allocations: row.update(run_once(args, length, True))
+        results.append(row)
+        print(f"history {length:>4}: {row['turns']} turns, overhead {row['overhead_per_turn_ms']:.2f} ms/turn, "
+              f"cleanup {row['history_cleanup_s']*1000:.1f} ms, memory recall {row['memory_recall_s']*1000:.1f} ms, "
+              f"memory tool {row['memory_tool_s']*1000:.1f} ms, shell {row['shell_s']*1000:.1f} ms"
+              + (f", peak {row['peak_kib']:.0f} KiB, retained {row['retained_kib']:.0f} KiB" if "peak_kib" in row else ""), flush=True)
+
+    if args.json:
+        with open(args.json, "w") as file: json.dump(results, file, indent=4)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for regression in regressions: print("REGRESSION " + regression)
+        if regressions: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import asyncio, hmac, json, os, models
+from urllib.parse import urlparse
+from aiohttp import web, WSMsgType
+from agent import AgentConfig
+from python.helpers.print_style import PrintStyle
+from python.helpers import http_pool, metrics
+from python.helpers.session_host import SessionHost, Session, valid_id
+
+
+HOST = os.getenv("AGENT_HOST", "127.0.0.1") # local only by default, set AGENT_TOKEN before binding to other interfaces
+PORT = int(os.getenv("AGENT_PORT", "50080"))
+TOKEN = os.getenv("AGENT_TOKEN", "") # if set, required as "Authorization: Bearer <token>" (or ?token= for websockets)
+ALLOWED_ORIGINS = [origin.strip() for origin in os.getenv("AGENT_ALLOWED_ORIGINS", "").split(",") if origin.strip()] # besides localhost pages
+LOCAL_HOSTNAMES = ("localhost", "127.0.0.1", "::1")
+
+
+def initialize():
+
+    # models and configuration shared by all sessions, see main.py for the other options
+    chat_llm = models.get_openai_chat(model_name="gpt-4o-mini", temperature=0)
+    utility_llm = chat_llm
+    embedding_llm = models.get_openai_embedding(model_name="text-embedding-3-small")
+
+    config = AgentConfig(
+        chat_model = chat_llm,
+        utility_model = utility_llm,
+        embeddings_model = embedding_llm,
+        auto_memory_count = 0,
+        code_exec_docker_enabled = True,
+        code_exec_ssh_enabled = True,
+    )
+
+    # each session gets its own agent tree, working directory, memory subdir and shell
+    host = SessionHost(config, max_sessions=int(os.getenv("AGENT_MAX_SESSIONS", "0")))
+    metrics.start() # if METRICS_PORT or METRICS_FILE is set
+    web.run_app(create_app(host), host=HOST, port=PORT)
+
+
+def create_app(host: SessionHost) -> web.Application:
+    app = web.Application(middlewares=[guard])
+    app["host"] = host
+    app.router.add_get("/sessions", list_sessions)
+    app.router.add_post("/sessions", create_session)
+    app.router.add_delete("/sessions/{id}", close_session)
+    app.router.add_post("/sessions/{id}/messages", send_message)
+    app.router.add_post("/sessions/{id}/pause", pause)
+    app.router.add_post("/sessions/{id}/resume", resume)
+    app.router.add_post("/sessions/{id}/intervene", intervene)
+    app.router.add_get("/sessions/{id}/ws", websocket)
+    app.on_startup.append(prewarm)
+    app.on_shutdown.append(lambda app: host.aclose_all())
+    return app
+
+
+async def prewarm(app: web.Application):
+    # open connections to the model APIs in the event loop serving the sessions, without delaying the startup
+    config = app["host"].config
+    urls = [url for model in (config.chat_model, config.utility_model, config.embeddings_model) for url in http_pool.get_base_urls(model)]
+    http_pool.prewarm(urls)
+    app["prewarm"] = asyncio.create_task(http_pool.aprewarm(urls)) # referenced, so the task is not garbage collected
+
+
+@web.middleware
+async def guard(request: web.Request, handler):
+    # the agents execute code: only clients with the token, and no cross site "simple" requests from web pages
+    if TOKEN:
+        auth = request.headers.get("Authorization", "")
+        token = auth[7:] if auth.startswith("Bearer ") else request.query.get("token", "") if request.path.endswith("/ws") else ""
+        if not hmac.compare_digest(token.encode("utf-8"), TOKEN.encode("utf-8")): raise web.HTTPUnauthorized(text="Missing or invalid token")
+    if request.method == "POST" and request.content_type != "application/json": raise web.HTTPUnsupportedMediaType(text="Content-Type must be application/json")
+    return await handler(request)
+
+def origin_allowed(request: web.Request) -> bool:
+    origin = request.headers.get("Origin")
+    if not origin: return True # not a browser
+    return origin in ALLOWED_ORIGINS or urlparse(origin).hostname in LOCAL_HOSTNAMES
+
+
+def get_session(request: web.Request) -> Session:
+    session = request.app["host"].get(request.match_info["id"])
+    if not session: raise web.HTTPNotFound(text=f"Session {request.match_info['id']} not found")
+    return session
+
+def session_info(session: Session) -> dict:
+    return {"id": session.context.id, "busy": session.busy, "paused": session.context.paused}
+
+async def read_json(request: web.Request) -> dict:
+    if not request.can_read_body: return {}
+    try: data = await request.json()
+    except json.JSONDecodeError: raise web.HTTPBadRequest(text="Request body is not valid JSON")
+    if not isinstance(data, dict): raise web.HTTPBadRequest(text="Request body must be a JSON object")
+    return data
+
+
+async def list_sessions(request: web.Request):
+    return web.json_response([session_info(session) for session in request.app["host"].sessions.values()])
+
+async def create_session(request: web.Request):
+    data = await read_json(request)
+    id = data.get("id", "")
+    if id and (not isinstance(id, str) or not valid_id(id)): raise web.HTTPBadRequest(text="Session id must be 1-64 letters, digits, '-' or '_'")
+    try: session = request.app["host"].create(id)
+    except ValueError as e: raise web.HTTPConflict(text=str(e))
+    PrintStyle(font_color="green", padding=True).print(f"Session {session.context.id} created")
+    return web.json_response(session_info(session), status=201)
+
+async def close_session(request: web.Request):
+    if not await request.app["host"].aclose(request.match_info["id"]): raise web.HTTPNotFound()
+    return web.json_response({"closed": request.match_info["id"]})
+
+async def send_message(request: web.Request):
+    session = get_session(request)
+    message = (await read_json(request)).get("message", "")
+    if session.busy: raise web.HTTPConflict(text="Session is processing another message")
+    return web.json_response({"response": await session.send(message)})
+
+async def pause(request: web.Request):
+    session = get_session(request)
+    session.context.paused = True
+    return web.json_response(session_info(session))
+
+async def resume(request: web.Request):
+    session = get_session(request)
+    session.context.paused = False
+    return web.json_response(session_info(session))
+
+async def intervene(request: web.Request):
+    session = get_session(request)
+    session.intervene((await read_json(request)).get("message", ""))
+    return web.json_response(session_info(session))
+
+
+async def websocket(request: web.Request):
+    # streams agent output of the session as JSON events, messages sent as {"message": "..."} are processed in order
+    if not origin_allowed(request): raise web.HTTPForbidden(text="Origin not allowed")
+    session = get_session(request)
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    listener = lambda event: loop.call_soon_threadsafe(events.put_nowait, event) # agents may stream from worker threads
+    session.context.listeners.append(listener)
+
+    async def forward():
+        while True: await ws.send_json(await events.get())
+
+    async def process(message: str):
+        try: events.put_nowait({"type": "response", "agent": session.agent.agent_name, "content": await session.send(message)})
+        except Exception as e: events.put_nowait({"type": "error", "agent": session.agent.agent_name, "content": str(e)})
+
+    forwarder = asyncio.create_task(forward())
+    tasks: set[asyncio.Task] = set()
+    try:
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT: continue
+            try: data = json.loads(msg.data)
+            except json.JSONDecodeError: data = {"message": msg.data} # plain text is a message too
+            if "intervene" in data: session.intervene(data["intervene"])
+            elif "paused" in data: session.context.paused = bool(data["paused"])
+            elif "message" in data:
+                task = asyncio.create_task(process(data["message"])) # queued on the session lock
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+    finally:
+        session.context.listeners.remove(listener)
+        forwarder.cancel()
+    return ws
+
+
+if __name__ == "__main__":
+    print("Initializing session host...")
+    initialize()
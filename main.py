@@ -1,18 +1,22 @@
-import threading, time, models, os
+import asyncio, threading, time, models, os
 from ansio import application_keypad, mouse_input, raw_input
 from ansio.input import InputEvent, get_input_event
-from agent import Agent, AgentConfig
+from agent import Agent, AgentConfig, AgentContext
 from python.helpers.print_style import PrintStyle
 from python.helpers.files import read_file
-from python.helpers import files
+from python.helpers import files, http_pool, metrics
 import python.helpers.timed_input as timed_input
 
 
 input_lock = threading.Lock()
+context = AgentContext() # the one console conversation
+loop = asyncio.new_event_loop() # kept for all messages, so pooled connections and background jobs survive between them
+warmup: threading.Thread | None = None # opens connections in the loop, joined before the first message uses it
 os.chdir(files.get_abs_path("./work_dir")) #change CWD to work_dir
 
 
 def initialize():
+    global warmup
     
     # main chat model used by agents (smarter, more accurate)
     chat_llm = models.get_openai_chat(model_name="gpt-4o-mini", temperature=0)
@@ -23,6 +27,7 @@ def initialize():
     # chat_llm = models.get_anthropic_chat(model_name="claude-3-5-sonnet-20240620", temperature=0)
     # chat_llm = models.get_google_chat(model_name="gemini-1.5-flash", temperature=0)
     # chat_llm = models.get_groq_chat(model_name="llama-3.1-70b-versatile", temperature=0)
+    # chat_llm = models.get_router_chat(models.get_openai_chat(model_name="gpt-4o-mini", temperature=0), models.get_groq_chat(model_name="llama-3.1-70b-versatile", temperature=0), max_concurrency=[8, 4])
     
     # utility model used for helper functions (cheaper, faster)
     utility_llm = chat_llm # change if you want to use a different utility model
@@ -40,13 +45,26 @@ def initialize():
         # memory_subdir = "",
         auto_memory_count = 0,
         # auto_memory_skip = 2,
+        # auto_memory_window = 6,
+        # auto_memory_timeout = 1,
         # rate_limit_seconds = 60,
         # rate_limit_requests = 30,
         # rate_limit_input_tokens = 0,
         # rate_limit_output_tokens = 0,
+        # rate_limit_adaptive = True,
         # msgs_keep_max = 25,
         # msgs_keep_start = 5,
         # msgs_keep_end = 10,
+        # msgs_hard_max = 40,
+        # msgs_rolling_summary = True,
+        # speculative_tools = True,
+        # stream_stop_on_tool = False,
+        # max_parallel_tools = 4,
+        # tools_hot_reload = False,
+        # subordinate_max_parallel = 3,
+        # subordinate_timeout_seconds = 600,
+        # checkpoints = False,
+        # adhoc_cache_mb = 64,
         # max_tool_response_length = 3000,
         # response_timeout_seconds = 60,
         code_exec_docker_enabled = True,
@@ -62,8 +80,14 @@ def initialize():
         # additional = {},
     )
     
+    # open connections to the model APIs while the user types the first message
+    warmup = http_pool.prewarm_models(chat_llm, utility_llm, embedding_llm, loop=loop)
+
+    # serve or write latency metrics if METRICS_PORT or METRICS_FILE is set
+    metrics.start()
+
     # create the first agent
-    agent0 = Agent( number = 0, config = config )
+    agent0 = Agent( number = 0, config = config, context = context )
 
     # start the chat loop
     chat(agent0)
@@ -104,7 +128,8 @@ def chat(agent:Agent):
         if user_input.lower() == 'e': break
 
         # send message to agent0, 
-        assistant_response = agent.message_loop(user_input)
+        if warmup: warmup.join() # usually done long before the user finished typing
+        assistant_response = loop.run_until_complete(agent.amessage_loop(user_input))
         
         # print agent0 response
         PrintStyle(font_color="white",background_color="#1D8348", bold=True, padding=True).print(f"{agent.agent_name}: reponse:")        
@@ -113,8 +138,8 @@ def chat(agent:Agent):
 
 # User intervention during agent streaming
 def intervention():
-    if Agent.streaming_agent and not Agent.paused:
-        Agent.paused = True # stop agent streaming
+    if context.streaming_agent and not context.paused:
+        context.paused = True # stop agent streaming
         PrintStyle(background_color="#6C3483", font_color="white", bold=True, padding=True).print(f"User intervention ('e' to leave, empty to continue):")        
 
         import readline # this fixes arrow keys in terminal
@@ -122,8 +147,8 @@ def intervention():
         PrintStyle(font_color="white", padding=False, log_only=True).print(f"> {user_input}")        
         
         if user_input.lower() == 'e': os._exit(0) # exit the conversation when the user types 'exit'
-        if user_input: Agent.streaming_agent.intervention_message = user_input # set intervention message if non-empty
-        Agent.paused = False # continue agent streaming 
+        if user_input and context.streaming_agent: context.streaming_agent.intervention_message = user_input # set intervention message if non-empty
+        context.paused = False # continue agent streaming 
     
 
 # Capture keyboard input to trigger user intervention
@@ -135,7 +160,7 @@ def capture_keys():
             intervent = False
             time.sleep(0.1)
             
-            if Agent.streaming_agent:
+            if context.streaming_agent:
                 # with raw_input, application_keypad, mouse_input:
                 with input_lock, raw_input, application_keypad:
                     event: InputEvent | None = get_input_event(timeout=0.1)
@@ -8,6 +8,10 @@ from langchain_groq import ChatGroq
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_google_genai import ChatGoogleGenerativeAI, HarmBlockThreshold, HarmCategory
 from pydantic.v1.types import SecretStr
+from python.helpers.tokens import register_tokenizer, tiktoken_tokenizer, get_tokenizer
+from python.helpers.rate_limiter import register_limit_key
+from python.helpers.model_router import ModelRouter
+from python.helpers import http_pool
 
 
 # Load environment variables
@@ -16,6 +20,14 @@ load_dotenv()
 # Configuration
 DEFAULT_TEMPERATURE = 0.0
 
+# HTTP clients: OpenAI compatible and Groq clients share the connection pools of python/helpers/http_pool.py
+
+# Rate limits: factories register the provider and API key of their models, agents using models
+# with the same key share one rate limiter (python/helpers/rate_limiter.py)
+
+# Token counting: factories register a tokenizer for the models they create,
+# models without one fall back to an approximate count (python/helpers/tokens.py)
+
 # Utility function to get API keys from environment variables
 def get_api_key(service):
     return os.getenv(f"API_KEY_{service.upper()}") or os.getenv(f"{service.upper()}_API_KEY")
@@ -23,7 +35,7 @@ def get_api_key(service):
 
 # Ollama models
 def get_ollama_chat(model_name:str, temperature=DEFAULT_TEMPERATURE, base_url="http://localhost:11434"):
-    return Ollama(model=model_name,temperature=temperature, base_url=base_url)
+    return register_limit_key(Ollama(model=model_name,temperature=temperature, base_url=base_url), "ollama", base_url)
 
 def get_ollama_embedding(model_name:str, temperature=DEFAULT_TEMPERATURE):
     return OllamaEmbeddings(model=model_name,temperature=temperature)
@@ -35,62 +47,66 @@ def get_huggingface_embedding(model_name:str):
 
 # LM Studio and other OpenAI compatible interfaces
 def get_lmstudio_chat(model_name:str, base_url="http://localhost:1234/v1", temperature=DEFAULT_TEMPERATURE):
-    return ChatOpenAI(model_name=model_name, base_url=base_url, temperature=temperature, api_key="none") # type: ignore
+    return register_limit_key(ChatOpenAI(model_name=model_name, base_url=base_url, temperature=temperature, api_key="none", http_client=http_pool.client(), http_async_client=http_pool.async_client()), "lmstudio", base_url) # type: ignore
 
 def get_lmstudio_embedding(model_name:str, base_url="http://localhost:1234/v1"):
-    return OpenAIEmbeddings(model_name=model_name, base_url=base_url) # type: ignore
+    return OpenAIEmbeddings(model_name=model_name, base_url=base_url, http_client=http_pool.client(), http_async_client=http_pool.async_client()) # type: ignore
 
 # Anthropic models
 def get_anthropic_chat(model_name:str, api_key=None, temperature=DEFAULT_TEMPERATURE):
     api_key = api_key or get_api_key("anthropic")
-    return ChatAnthropic(model_name=model_name, temperature=temperature, api_key=api_key) # type: ignore
+    return register_limit_key(ChatAnthropic(model_name=model_name, temperature=temperature, api_key=api_key), "anthropic", api_key) # type: ignore
 
 # OpenAI models
 def get_openai_chat(model_name:str, api_key=None, temperature=DEFAULT_TEMPERATURE):
     api_key = api_key or get_api_key("openai")
-    return ChatOpenAI(model_name=model_name, temperature=temperature, api_key=api_key) # type: ignore
+    return register_limit_key(register_tokenizer(ChatOpenAI(model_name=model_name, temperature=temperature, api_key=api_key, http_client=http_pool.client(), http_async_client=http_pool.async_client()), tiktoken_tokenizer(model_name)), "openai", api_key) # type: ignore
 
 def get_openai_instruct(model_name:str,api_key=None, temperature=DEFAULT_TEMPERATURE):
     api_key = api_key or get_api_key("openai")
-    return OpenAI(model=model_name, temperature=temperature, api_key=api_key) # type: ignore
+    return register_limit_key(register_tokenizer(OpenAI(model=model_name, temperature=temperature, api_key=api_key, http_client=http_pool.client(), http_async_client=http_pool.async_client()), tiktoken_tokenizer(model_name)), "openai", api_key) # type: ignore
 
 def get_openai_embedding(model_name:str, api_key=None):
     api_key = api_key or get_api_key("openai")
-    return OpenAIEmbeddings(model=model_name, api_key=api_key) # type: ignore
+    return OpenAIEmbeddings(model=model_name, api_key=api_key, http_client=http_pool.client(), http_async_client=http_pool.async_client()) # type: ignore
 
 def get_azure_openai_chat(deployment_name:str, api_key=None, temperature=DEFAULT_TEMPERATURE, azure_endpoint=None):
     api_key = api_key or get_api_key("openai_azure")
     azure_endpoint = azure_endpoint or os.getenv("OPENAI_AZURE_ENDPOINT")
-    return AzureChatOpenAI(deployment_name=deployment_name, temperature=temperature, api_key=api_key, azure_endpoint=azure_endpoint) # type: ignore
+    return register_limit_key(register_tokenizer(AzureChatOpenAI(deployment_name=deployment_name, temperature=temperature, api_key=api_key, azure_endpoint=azure_endpoint, http_client=http_pool.client(), http_async_client=http_pool.async_client()), tiktoken_tokenizer(deployment_name)), "openai_azure", api_key) # type: ignore
 
 def get_azure_openai_instruct(deployment_name:str, api_key=None, temperature=DEFAULT_TEMPERATURE, azure_endpoint=None):
     api_key = api_key or get_api_key("openai_azure")
     azure_endpoint = azure_endpoint or os.getenv("OPENAI_AZURE_ENDPOINT")
-    return AzureOpenAI(deployment_name=deployment_name, temperature=temperature, api_key=api_key, azure_endpoint=azure_endpoint) # type: ignore
+    return register_limit_key(register_tokenizer(AzureOpenAI(deployment_name=deployment_name, temperature=temperature, api_key=api_key, azure_endpoint=azure_endpoint, http_client=http_pool.client(), http_async_client=http_pool.async_client()), tiktoken_tokenizer(deployment_name)), "openai_azure", api_key) # type: ignore
 
 def get_azure_openai_embedding(deployment_name:str, api_key=None, azure_endpoint=None):
     api_key = api_key or get_api_key("openai_azure")
     azure_endpoint = azure_endpoint or os.getenv("OPENAI_AZURE_ENDPOINT")
-    return AzureOpenAIEmbeddings(deployment_name=deployment_name, api_key=api_key, azure_endpoint=azure_endpoint) # type: ignore
+    return AzureOpenAIEmbeddings(deployment_name=deployment_name, api_key=api_key, azure_endpoint=azure_endpoint, http_client=http_pool.client(), http_async_client=http_pool.async_client()) # type: ignore
 
 # Google models
 def get_google_chat(model_name:str, api_key=None, temperature=DEFAULT_TEMPERATURE):
     api_key = api_key or get_api_key("google")
-    return ChatGoogleGenerativeAI(model=model_name, temperature=temperature, google_api_key=api_key, safety_settings={HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE }) # type: ignore
+    return register_limit_key(ChatGoogleGenerativeAI(model=model_name, temperature=temperature, google_api_key=api_key, safety_settings={HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE }), "google", api_key) # type: ignore
 
 # Groq models
 def get_groq_chat(model_name:str, api_key=None, temperature=DEFAULT_TEMPERATURE):
     api_key = api_key or get_api_key("groq")
-    return ChatGroq(model_name=model_name, temperature=temperature, api_key=api_key) # type: ignore
+    return register_limit_key(ChatGroq(model_name=model_name, temperature=temperature, api_key=api_key, http_client=http_pool.client(), http_async_client=http_pool.async_client()), "groq", api_key) # type: ignore
    
 # OpenRouter models
 def get_openrouter(model_name: str="meta-llama/llama-3.1-8b-instruct:free", api_key=None, temperature=DEFAULT_TEMPERATURE):
     api_key = api_key or get_api_key("openrouter")
-    return ChatOpenAI(api_key=api_key, base_url="https://openrouter.ai/api/v1", model=model_name, temperature=temperature) # type: ignore
+    return register_limit_key(ChatOpenAI(api_key=api_key, base_url="https://openrouter.ai/api/v1", model=model_name, temperature=temperature, http_client=http_pool.client(), http_async_client=http_pool.async_client()), "openrouter", api_key) # type: ignore
         
+# Router over several chat models, picks the fastest healthy one for each call and fails over on rate limits and server errors
+def get_router_chat(*backends, max_concurrency: list[int] | None = None):
+    return register_tokenizer(ModelRouter(backends=list(backends), max_concurrency=max_concurrency or []), get_tokenizer(backends[0]))
+
 def get_embedding_hf(model_name="sentence-transformers/all-MiniLM-L6-v2"):
     return HuggingFaceEmbeddings(model_name=model_name)
 
 def get_embedding_openai(api_key=None):
     api_key = api_key or get_api_key("openai")
-    return OpenAIEmbeddings(api_key=api_key) #type: ignore
+    return OpenAIEmbeddings(api_key=api_key, http_client=http_pool.client(), http_async_client=http_pool.async_client()) #type: ignore
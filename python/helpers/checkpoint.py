@@ -0,0 +1,126 @@
+import os, pickle, struct, threading
+from typing import Any, Iterator, NamedTuple
+from langchain_core.messages import HumanMessage, AIMessage
+from . import files
+
+# Append-only checkpoint of one agent tree (one conversation), a sequence of length prefixed pickled records:
+#   ("agent", index, number)                                   agent created in the tree
+#   ("append", index, msg, human)                              append_message call, replayed as is
+#   ("history", index, [(type, content)], summary_pos, summary) history replaced by a cleanup
+#   ("data", index, field, value)                              set_data call, agents stored as AgentRef
+# Resuming replays the records, so a crash mid-write only loses the last, incomplete record.
+
+DIRECTORY = "checkpoints"
+HEADER = struct.Struct("<I")
+SKIP_DATA = {"cot_state"} # live shell connections, reconnected lazily by the tool after resume
+
+class AgentRef(NamedTuple):
+    index: int
+
+
+class Checkpoint:
+    def __init__(self, id: str):
+        self.id = id
+        self.path = get_path(id)
+        self.agents: list = [] # agent objects by index
+        self.replaying = False
+        self.file = None
+        self.lock = threading.Lock() # tools can set data from worker threads
+
+    def register(self, agent) -> int:
+        self.agents.append(agent)
+        self.write(("agent", len(self.agents) - 1, agent.number, agent.agent_name))
+        return len(self.agents) - 1
+
+    def append(self, agent, msg: str, human: bool):
+        self.write(("append", agent.checkpoint_index, msg, human))
+
+    def replace_history(self, agent):
+        summary_pos = next((i for i, msg in enumerate(agent.history) if msg is agent.summary_message), None)
+        self.write(("history", agent.checkpoint_index, [(msg.type, msg.content) for msg in agent.history], summary_pos, agent.history_summary))
+
+    def set_data(self, agent, field: str, value: Any):
+        if field in SKIP_DATA: return
+        value = self.encode(value)
+        try: pickle.dumps(value)
+        except Exception: return # not serializable, lost on resume
+        self.write(("data", agent.checkpoint_index, field, value))
+
+    def write(self, record: tuple):
+        if self.replaying: return
+        data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            if not self.file:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.file = open(self.path, "ab")
+            self.file.write(HEADER.pack(len(data)) + data)
+            self.file.flush() # one small write per message, no fsync
+
+    def close(self):
+        with self.lock:
+            if self.file: self.file.close()
+            self.file = None
+
+    def encode(self, value):
+        if hasattr(value, "checkpoint_index"): return AgentRef(value.checkpoint_index)
+        if isinstance(value, list): return [self.encode(item) for item in value]
+        return value
+
+    def decode(self, value):
+        if isinstance(value, AgentRef): return self.agents[value.index]
+        if isinstance(value, list): return [self.decode(item) for item in value]
+        return value
+
+
+def get_path(id: str) -> str:
+    if not id or os.path.basename(id) != id or id.startswith("."): raise ValueError(f"Invalid checkpoint id: {id!r}") # never load a pickle from elsewhere
+    return files.get_abs_path(DIRECTORY, f"{id}.ckpt")
+
+def exists(id: str) -> bool:
+    return os.path.isfile(get_path(id))
+
+def read_records(path: str) -> Iterator[tuple[int, tuple]]:
+    # yields records with the offset after each one, stops at a truncated tail
+    with open(path, "rb") as f:
+        data = f.read()
+    pos = 0
+    while pos + HEADER.size <= len(data):
+        size, = HEADER.unpack_from(data, pos)
+        end = pos + HEADER.size + size
+        if end > len(data): break
+        try: record = pickle.loads(data[pos + HEADER.size:end])
+        except Exception: break
+        pos = end
+        yield pos, record
+
+def resume(id: str, config, context=None):
+    # rebuild the agent tree of a checkpointed conversation, returns its top agent or None
+    from agent import Agent, AgentContext
+
+    if not exists(id): return None
+    context = context or AgentContext(id)
+    checkpoint = Checkpoint(id)
+    context.checkpoint = checkpoint
+    checkpoint.replaying = True
+    valid = 0
+    try:
+        for valid, record in read_records(checkpoint.path):
+            kind, index = record[0], record[1]
+            if kind == "agent":
+                Agent(record[2], config, context, *record[3:4]) # registers itself at the next index, older checkpoints have no name
+            elif kind == "append":
+                checkpoint.agents[index].append_message(record[2], human=record[3])
+            elif kind == "history":
+                agent = checkpoint.agents[index]
+                agent.history = [HumanMessage(content=content) if type == "human" else AIMessage(content=content) for type, content in record[2]]
+                agent.history_tokens.sync(agent.history)
+                agent.summary_message = agent.history[record[3]] if record[3] is not None else None
+                agent.history_summary = record[4]
+            elif kind == "data":
+                checkpoint.agents[index].set_data(record[2], checkpoint.decode(record[3]))
+    finally:
+        checkpoint.replaying = False
+
+    if valid < os.path.getsize(checkpoint.path): # drop an incomplete record so new ones stay readable
+        with open(checkpoint.path, "r+b") as f: f.truncate(valid)
+    return checkpoint.agents[0] if checkpoint.agents else None
@@ -60,13 +60,13 @@ class DirtyJson:
     def _parse_value(self):
         self._skip_whitespace()
         if self.current_char == '{':
-            if self._peek(1) == '{':  # Handle {{
-                self._advance(2)
+            if self._peek(2) == '{{':  # Handle {{
+                self._advance()
             return self._parse_object()
         elif self.current_char == '[':
             return self._parse_array()
         elif self.current_char in ['"', "'", "`"]:
-            if self._peek(2) == self.current_char * 2:  # type: ignore
+            if self._peek(3) == self.current_char * 3:  # type: ignore # multiline, two quotes are an empty string
                 return self._parse_multiline_string()
             return self._parse_string()
         elif self.current_char and (self.current_char.isdigit() or self.current_char in ['-', '+']):
@@ -99,10 +99,7 @@ class DirtyJson:
         while self.current_char is not None:
             self._skip_whitespace()
             if self.current_char == '}':
-                if self._peek(1) == '}':  # Handle }}
-                    self._advance(2)
-                else:
-                    self._advance()
+                self._advance() # a second brace of }} is left to the enclosing value
                 self.stack.pop()
                 return
             if self.current_char is None:
@@ -12,11 +12,18 @@
 #     result = api.run(query)
 #     return result
 
+import threading
 from duckduckgo_search import DDGS
 
+local = threading.local() # DDGS keeps its session, one instance per thread
+
+def get_ddgs() -> DDGS:
+    if not hasattr(local, "ddgs"): local.ddgs = DDGS()
+    return local.ddgs
+
 def search(query: str, results = 5, region = "wt-wt", time="y") -> list[str]:
 
-    ddgs = DDGS()
+    ddgs = get_ddgs()
     src = ddgs.text(
         query,
         region=region,  # Specify region 
@@ -14,6 +14,84 @@ def json_parse_dirty(json:str) -> dict[str,Any] | None:
         if isinstance(data,dict): return data
     return None
 
+def get_tool_requests(data: dict[str,Any] | None) -> list[dict[str,Any]]:
+    # a message requests either a single tool or a list of "tool_calls"
+    if not isinstance(data, dict): return []
+    calls = data.get("tool_calls")
+    if isinstance(calls, list):
+        return [{"tool_name": call.get("tool_name", ""), "tool_args": call.get("tool_args", {})} for call in calls if isinstance(call, dict)]
+    if "tool_name" in data:
+        return [{"tool_name": data.get("tool_name", ""), "tool_args": data.get("tool_args", {})}]
+    return []
+
+class ToolRequestStream:
+    # scans streamed text for the tool request object and reports each tool call as soon as its tool_args are complete
+    def __init__(self):
+        self.text = ""
+        self.start = -1 # index of the top level opening brace
+        self.end = -1 # index after the top level closing brace
+        self.pos = 0
+        self.stack: list[str] = [] # open braces and brackets
+        self.quote = "" # quote character of the open string, '"', "'" or "`" like DirtyJson, tripled for multiline strings
+        self.escaped = False
+        self.tool_requests: list[dict[str,Any]] = []
+
+    @property
+    def depth(self) -> int:
+        return len(self.stack)
+
+    def feed(self, chunk: str) -> list[dict[str,Any]]:
+        self.text += chunk
+        while self.pos < len(self.text) and self.end < 0:
+            char = self.text[self.pos]
+            if self.quote:
+                if len(self.quote) == 3: # multiline strings have no escapes and only close on three quotes
+                    if self.text.startswith(self.quote, self.pos):
+                        self.pos += 3
+                        self.quote = ""
+                        continue
+                    if len(self.text) - self.pos < 3 and self.quote.startswith(self.text[self.pos:]): break # maybe a split closing quote, wait for more text
+                elif self.escaped: self.escaped = False
+                elif char == "\\": self.escaped = True
+                elif char == self.quote: self.quote = ""
+                self.pos += 1
+            elif char in "\"'`" and self.depth > 0:
+                if len(self.text) - self.pos < 3: break # need the next two characters to tell a multiline string
+                self.quote = char * 3 if self.text.startswith(char * 3, self.pos) else char
+                self.pos += len(self.quote)
+            else:
+                self.pos += 1
+                if char in "{[":
+                    if self.depth == 0:
+                        if char == "[": continue # only objects are tool requests
+                        self.start = self.pos - 1
+                    self.stack.append(char)
+                elif char in "}]" and self.depth > 0:
+                    self.stack.pop()
+                    if self.depth == 0: self.end = self.pos
+                    if self.depth <= 2: self._check_requests()
+        return self.tool_requests
+
+    def _check_requests(self):
+        # a top level member, a tool_calls item or the whole object has just closed, see which requests are ready
+        text = self.text[self.start:self.pos]
+        try: data = DirtyJson.parse_string(text)
+        except Exception: return # not parseable yet, the final message is parsed again anyway
+        if not isinstance(data, dict) or not data: return
+        last_key = list(data)[-1]
+        if isinstance(data.get("tool_calls"), list):
+            if last_key != "tool_calls" and self.depth > 1: return # closed inside another member
+            calls = data["tool_calls"]
+        elif self.depth <= 1 and (last_key == "tool_args" or self.end >= 0):
+            calls = [data]
+        else: return
+        requests = [request for request in get_tool_requests({"tool_calls": calls}) if request["tool_name"] and isinstance(request["tool_args"], dict)]
+        if len(requests) > len(self.tool_requests): self.tool_requests = requests
+
+    @property
+    def closed(self) -> bool:
+        return self.end >= 0
+
 def extract_json_object_string(content):
     start = content.find('{')
     if start == -1:
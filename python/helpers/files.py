@@ -1,20 +1,34 @@
 import os, re, sys
 
+placeholder_pattern = re.compile(r"\{\{(\w+)\}\}")
+
+# compiled templates by absolute path: (mtime, literal segments, placeholder names between them)
+templates: dict[str, tuple[float, list[str], list[str]]] = {}
+
 def read_file(relative_path, **kwargs):
     absolute_path = get_abs_path(relative_path)  # Construct the absolute path to the target file
+    literals, names = get_template(absolute_path)
+
+    # Replace placeholders with values from kwargs, placeholders without a value are kept
+    parts = [literals[0]]
+    for name, literal in zip(names, literals[1:]):
+        parts.append(str(kwargs[name]) if name in kwargs else "{{" + name + "}}")
+        parts.append(literal)
+    return "".join(parts)
+
+def get_template(absolute_path):
+    mtime = os.path.getmtime(absolute_path) # edited prompt files are picked up live
+    cached = templates.get(absolute_path)
+    if cached and cached[0] == mtime:
+        return cached[1], cached[2]
 
     with open(absolute_path) as f:
         content = remove_code_fences(f.read())
 
-    # Replace placeholders with values from kwargs
-    for key, value in kwargs.items():
-        placeholder = "{{" + key + "}}"
-        strval = str(value)
-        # strval = strval.encode('unicode_escape').decode('utf-8')
-        # content = re.sub(re.escape(placeholder), strval, content)
-        content = content.replace(placeholder, strval)
-
-    return content
+    segments = placeholder_pattern.split(content) # literal, name, literal, name, ..., literal
+    literals, names = segments[0::2], segments[1::2]
+    templates[absolute_path] = (mtime, literals, names)
+    return literals, names
 
 def remove_code_fences(text):
     return re.sub(r'~~~\w*\n|~~~', '', text)
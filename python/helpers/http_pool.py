@@ -0,0 +1,92 @@
+import asyncio, importlib.util, os, threading, weakref
+from typing import Callable
+import httpx
+
+# Process wide HTTP connection pools shared by the model and search clients.
+# Keep-alive connections are reused across calls, HTTP/2 is used when the h2 package is installed.
+
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+TIMEOUT = httpx.Timeout(float(os.getenv("HTTP_TIMEOUT", "600")), connect=10) # streamed generations can take minutes
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+_lock = threading.Lock()
+_client: httpx.Client | None = None
+_async_client: httpx.AsyncClient | None = None
+response_hooks: list[Callable[[httpx.Response], None]] = [] # called with every response, e.g. to read rate limit headers
+
+
+def limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE, keepalive_expiry=KEEPALIVE_EXPIRY)
+
+
+class LoopTransport(httpx.AsyncBaseTransport):
+    # async connections belong to the event loop that opened them, sync wrappers run each call in a new loop,
+    # so the shared async client keeps one pool per running loop
+    def __init__(self):
+        self.transports: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport] = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+
+    def get(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            transport = self.transports.get(loop)
+            if transport is None:
+                transport = self.transports[loop] = httpx.AsyncHTTPTransport(limits=limits(), http2=HTTP2)
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.get().handle_async_request(request)
+
+    async def aclose(self):
+        transport = self.transports.pop(asyncio.get_running_loop(), None)
+        if transport: await transport.aclose()
+
+
+def on_response(response: httpx.Response):
+    for hook in response_hooks: hook(response)
+
+async def aon_response(response: httpx.Response):
+    on_response(response) # hooks only read headers, no need to await anything
+
+def client() -> httpx.Client:
+    global _client
+    with _lock:
+        if _client is None: _client = httpx.Client(limits=limits(), http2=HTTP2, timeout=TIMEOUT, event_hooks={"response": [on_response]})
+        return _client
+
+def async_client() -> httpx.AsyncClient:
+    global _async_client
+    with _lock:
+        if _async_client is None: _async_client = httpx.AsyncClient(transport=LoopTransport(), timeout=TIMEOUT, event_hooks={"response": [aon_response]})
+        return _async_client
+
+
+def get_base_urls(model) -> list[str]:
+    # OpenAI compatible and Groq clients expose their endpoint on the underlying SDK client
+    base_url = getattr(getattr(getattr(model, "client", None), "_client", None), "base_url", None)
+    if base_url: return [str(base_url)]
+    return [url for backend in getattr(model, "backends", []) for url in get_base_urls(backend)] # model router
+
+async def aprewarm(urls: list[str]):
+    # open connections (DNS, TCP and TLS) before the first call, the response itself does not matter
+    async def connect(url: str):
+        try: await async_client().head(url, timeout=5)
+        except Exception: pass
+    await asyncio.gather(*[connect(url) for url in dict.fromkeys(urls)])
+
+def prewarm(urls: list[str], loop: asyncio.AbstractEventLoop | None = None) -> threading.Thread | None:
+    # the sync pool is warmed in background threads, the async pool in the given loop that will run the agents,
+    # also from a background thread, which the caller joins before running the loop itself
+    def connect(url: str):
+        try: client().head(url, timeout=5)
+        except Exception: pass
+    for url in dict.fromkeys(urls): threading.Thread(target=connect, args=(url,), daemon=True).start()
+    if not loop or not urls: return None
+    thread = threading.Thread(target=loop.run_until_complete, args=(aprewarm(urls),), name="prewarm", daemon=True)
+    thread.start()
+    return thread
+
+def prewarm_models(*models, loop: asyncio.AbstractEventLoop | None = None) -> threading.Thread | None:
+    return prewarm([url for model in models for url in get_base_urls(model)], loop)
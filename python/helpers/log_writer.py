@@ -0,0 +1,94 @@
+import gzip, os, queue, shutil, threading
+from datetime import datetime
+
+# Background writer for log files: callers only put text into a bounded queue,
+# a thread appends it in batches and starts a new file (optionally gzipping the old one) over the size limit.
+
+MAX_BYTES = int(float(os.getenv("LOG_MAX_MB", "10")) * 1024 * 1024) # per file, 0 = no rotation
+GZIP = os.getenv("LOG_GZIP", "").lower() in ("1", "true", "yes")
+QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "100000")) # entries, writes are dropped (and counted) when full
+
+class LogWriter:
+    def __init__(self, directory: str, name_format: str, header: str = "", footer: str = "", max_bytes: int = MAX_BYTES, gzip_rotated: bool = GZIP):
+        self.directory = directory
+        self.name_format = name_format # strftime pattern, e.g. "log_%Y%m%d_%H%M%S.html"
+        self.header = header
+        self.footer = footer
+        self.max_bytes = max_bytes
+        self.gzip_rotated = gzip_rotated
+        self.queue: queue.Queue = queue.Queue(QUEUE_SIZE)
+        self.dropped = 0
+        self.part = 1
+        self.size = 0
+        self.file = None
+        self.closed = False
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, datetime.now().strftime(name_format))
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, text: str):
+        if self.closed: return
+        try: self.queue.put_nowait(text)
+        except queue.Full: self.dropped += 1 # never block the console on the disk
+
+    def flush(self, timeout: float = 5):
+        # wait until everything written so far is on disk
+        done = threading.Event()
+        try: self.queue.put(done, timeout=timeout)
+        except queue.Full: return
+        done.wait(timeout)
+
+    def close(self, timeout: float = 5):
+        if self.closed: return
+        self.queue.put(None) # stop marker, after everything already queued
+        self.closed = True
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < 1000: # drain what is ready into one write
+                try: batch.append(self.queue.get_nowait())
+                except queue.Empty: break
+            text = "".join(item for item in batch if isinstance(item, str))
+            try: self._write(text)
+            except OSError: pass # logging must not break the agent
+            for item in batch:
+                if isinstance(item, threading.Event): item.set()
+            if None in batch:
+                try: self._finish()
+                except OSError: pass
+                return
+
+    def _write(self, text: str):
+        if self.dropped:
+            text = f"\n[{self.dropped} log entries dropped]\n" + text
+            self.dropped = 0
+        if not text: return
+        if not self.file: self._open()
+        if self.max_bytes and self.size and self.size + len(text) > self.max_bytes: self._rotate()
+        self.file.write(text) # type: ignore
+        self.file.flush() # type: ignore
+        self.size += len(text)
+
+    def _open(self):
+        self.file = open(self.path, "w" if self.header else "a", encoding="utf-8")
+        self.file.write(self.header)
+        self.size = len(self.header)
+
+    def _finish(self):
+        if not self.file: return
+        self.file.write(self.footer)
+        self.file.close()
+        self.file = None
+
+    def _rotate(self):
+        self._finish()
+        if self.gzip_rotated:
+            with open(self.path, "rb") as src, gzip.open(self.path + ".gz", "wb") as dst: shutil.copyfileobj(src, dst)
+            os.remove(self.path)
+        self.part += 1
+        base, ext = os.path.splitext(os.path.join(self.directory, datetime.now().strftime(self.name_format)))
+        self.path = f"{base}_part{self.part}{ext}"
+        self._open()
@@ -0,0 +1,142 @@
+import http.server, os, threading, time
+from . import trace
+from .tool_registry import tools
+
+# Latency and error metrics of the agent loop in the Prometheus text format,
+# served on a local port (METRICS_PORT) and/or written to a file every few seconds (METRICS_FILE, e.g. for the node exporter textfile collector).
+# Timings come from the finished trace spans, counters are incremented by the agent directly.
+
+PORT = int(os.getenv("METRICS_PORT", "0"))
+FILE = os.getenv("METRICS_FILE", "")
+INTERVAL = float(os.getenv("METRICS_INTERVAL", "15")) # seconds between file writes
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, label: str = ""):
+        self.name = name
+        self.help = help
+        self.label = label # optional label name, e.g. the tool name
+        self.series: dict[str, list] = {} # label value -> bucket counts, sum and count
+
+    def observe(self, value: float, label_value: str = ""):
+        series = self.series.setdefault(label_value, [0] * len(BUCKETS) + [0.0, 0])
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound: series[i] += 1 # buckets are cumulative
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_value, series in sorted(self.series.items()):
+            labels = f'{self.label}="{escape(label_value)}",' if self.label else ""
+            lines += [f'{self.name}_bucket{{{labels}le="{bound}"}} {count}' for bound, count in zip(BUCKETS, series)]
+            lines.append(f'{self.name}_bucket{{{labels}le="+Inf"}} {series[-1]}')
+            labels = f"{{{labels[:-1]}}}" if labels else ""
+            lines += [f"{self.name}_sum{labels} {series[-2]}", f"{self.name}_count{labels} {series[-1]}"]
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, label: str = ""):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values: dict[str, float] = {}
+
+    def inc(self, label_value: str = "", amount: float = 1):
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_value, value in sorted(self.values.items()):
+            labels = f'{{{self.label}="{escape(label_value)}"}}' if self.label else ""
+            lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+histograms = {metric.name: metric for metric in [
+    Histogram("agent_llm_ttft_seconds", "Time to the first chunk of model calls.", "call"),
+    Histogram("agent_llm_generation_seconds", "Total time of model calls, from request to the last chunk.", "call"),
+    Histogram("agent_tool_seconds", "Tool execution time, including the wait for a free tool slot.", "tool"),
+    Histogram("agent_shell_read_seconds", "Time spent collecting shell output of code execution."),
+    Histogram("agent_rate_limit_wait_seconds", "Time calls waited for the rate limiter."),
+    Histogram("agent_memory_recall_seconds", "Time of automatic memory recall, vector search and cleanup of the found memories."),
+    Histogram("agent_compaction_seconds", "Time to summarize old history messages."),
+]}
+counters = {metric.name: metric for metric in [
+    Counter("agent_llm_calls_total", "Model calls, cached utility responses excluded.", "call"),
+    Counter("agent_utility_cache_hits_total", "Utility calls answered from the response cache."),
+    Counter("agent_misformatted_responses_total", "Agent responses without a valid tool request."),
+    Counter("agent_repeated_responses_total", "Agent responses repeating the previous one."),
+    Counter("agent_errors_total", "Errors forwarded to the agent in the message loop.", "error"),
+]}
+
+enabled = False
+_lock = threading.Lock()
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def observe(name: str, value: float, label_value: str = ""):
+    if not enabled: return
+    with _lock: histograms[name].observe(value, label_value)
+
+def inc(name: str, label_value: str = "", amount: float = 1):
+    if not enabled: return
+    with _lock: counters[name].inc(label_value, amount)
+
+def observe_span(record: dict):
+    # trace listener, maps finished spans to histograms
+    span, duration = record["span"], record["duration"]
+    if span in ("llm_call", "utility_call"):
+        call = "chat" if span == "llm_call" else "utility"
+        if record.get("cached"): return inc("agent_utility_cache_hits_total")
+        inc("agent_llm_calls_total", call)
+        observe("agent_llm_generation_seconds", duration, call)
+        if "ttft" in record: observe("agent_llm_ttft_seconds", record["ttft"], call)
+    elif span == "tool_execute": observe("agent_tool_seconds", duration, record.get("tool", "") if tools.has(record.get("tool", "")) else "unknown") # names come from the model, keep the label set bounded
+    elif span == "shell_read": observe("agent_shell_read_seconds", duration)
+    elif span == "rate_limit_wait": observe("agent_rate_limit_wait_seconds", duration)
+    elif span == "memory_recall": observe("agent_memory_recall_seconds", duration)
+    elif span == "history_compaction": observe("agent_compaction_seconds", duration)
+
+def render() -> str:
+    with _lock: lines = [line for metric in [*histograms.values(), *counters.values()] for line in metric.render()]
+    return "\n".join(lines) + "\n"
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # scrapes would flood the console
+
+def write_file(path: str):
+    # written next to the target and renamed, so readers never see a partial file
+    with open(path + ".tmp", "w", encoding="utf-8") as file: file.write(render())
+    os.replace(path + ".tmp", path)
+
+def start(port: int = PORT, file: str = FILE, interval: float = INTERVAL):
+    # no-op unless a port or file is configured
+    global enabled
+    if enabled or not (port or file): return
+    enabled = True
+    trace.listeners.append(observe_span)
+    if port:
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler) # local only, like the session host
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    if file:
+        def write_loop():
+            while True:
+                try: write_file(file)
+                except OSError: pass # metrics must not break the agent
+                time.sleep(interval)
+        threading.Thread(target=write_loop, name="metrics-file", daemon=True).start()
@@ -0,0 +1,167 @@
+import asyncio, threading, time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage, BaseMessageChunk, message_chunk_to_message
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+from python.helpers.print_style import PrintStyle
+from python.helpers import rate_limiter, tokens
+
+RETRY_STATUS = {408, 409, 429} # plus all 5xx
+RETRY_ERRORS = ("Timeout", "Connection", "Overloaded", "RateLimit", "ServiceUnavailable", "InternalServer") # error class names without a status code
+
+
+class BackendStats:
+    def __init__(self, limit: int):
+        self.limit = limit # concurrent calls, 0 = unlimited
+        self.active = 0
+        self.ttft = 0.0 # moving average of seconds to first chunk, 0 until measured
+        self.error_rate = 0.0 # moving average of failed calls
+        self.cooldown_until = 0.0 # skipped until then after a rate limit or server error
+        self.failures = 0 # consecutive, for the cooldown backoff
+
+    @property
+    def free(self) -> bool:
+        return not self.limit or self.active < self.limit
+
+
+class ModelRouter(BaseChatModel):
+    """Chat model routing each call to one of several backends by observed time to first token and error rate.
+    Calls failing before their first chunk with a rate limit or server error are retried on the next backend."""
+
+    backends: list
+    max_concurrency: list = [] # per backend, 0 or missing = unlimited
+    smoothing: float = 0.3 # weight of the newest sample in the moving averages
+    error_penalty: float = 4.0 # an always failing backend counts as this many times slower
+    cooldown_seconds: float = 5.0 # first cooldown after a failure, doubles with each consecutive one up to a minute
+    _stats: list = PrivateAttr(default_factory=list)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock) # calls come from the event loop and from worker threads
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        limits = list(self.max_concurrency) + [0] * (len(self.backends) - len(self.max_concurrency))
+        self._stats = [BackendStats(limit) for limit in limits]
+
+    @property
+    def _llm_type(self) -> str:
+        return "model-router"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"backends": [f"{type(backend).__name__}:{getattr(backend, '_identifying_params', {})}" for backend in self.backends]}
+
+    def _rank(self) -> list[int]:
+        # usable backends ordered by expected latency, unmeasured ones first so each gets tried
+        now = time.time()
+        slowest = max(stats.ttft for stats in self._stats) or 1.0 # latency assumed for backends failing before their first chunk
+        score = lambda i: (self._stats[i].ttft or (slowest if self._stats[i].error_rate else 0.0)) * (1 + self.error_penalty * self._stats[i].error_rate)
+        ready = [i for i, stats in enumerate(self._stats) if stats.cooldown_until <= now]
+        cooling = sorted((i for i in range(len(self._stats)) if i not in ready), key=lambda i: self._stats[i].cooldown_until)
+        return sorted(ready, key=score) + cooling # all cooling down: the one recovering first is still better than failing
+
+    def _acquire(self, tried: set[int]) -> int | None:
+        with self._lock:
+            candidates = [i for i in self._rank() if i not in tried]
+            if not candidates: raise RuntimeError("No model backend left to try")
+            for i in candidates:
+                if self._stats[i].free:
+                    self._stats[i].active += 1
+                    return i
+            return None # all at their concurrency limit, wait
+
+    def _release(self, i: int, ttft: float | None, error: Exception | None):
+        with self._lock:
+            stats = self._stats[i]
+            stats.active -= 1
+            stats.error_rate += self.smoothing * ((1.0 if error else 0.0) - stats.error_rate)
+            if ttft is not None: stats.ttft = ttft if not stats.ttft else stats.ttft + self.smoothing * (ttft - stats.ttft)
+            if error:
+                stats.failures += 1
+                stats.cooldown_until = time.time() + min(60, self.cooldown_seconds * 2 ** (stats.failures - 1))
+            elif ttft is not None: stats.failures = 0
+
+    def _count_input(self, i: int, messages: List[BaseMessage]) -> int:
+        tokenizer = tokens.get_tokenizer(self.backends[i])
+        return sum(tokenizer(str(message.content)) for message in messages)
+
+    def _should_retry(self, i: int, error: Exception, tried: set[int]) -> bool:
+        status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+        retry = status in RETRY_STATUS or (isinstance(status, int) and status >= 500) or (status is None and any(name in type(error).__name__ for name in RETRY_ERRORS))
+        if not retry or len(tried) >= len(self.backends): return False
+        PrintStyle(font_color="orange", padding=True).print(f"Model backend {i} ({type(self.backends[i]).__name__}) failed with {type(error).__name__}, trying another one")
+        return True
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        tried: set[int] = set()
+        while True:
+            i = self._acquire(tried)
+            if i is None:
+                time.sleep(0.05)
+                continue
+            tried.add(i)
+            limiter, record, output = rate_limiter.find_limiter(self.backends[i]), None, ""
+            ttft, error = None, None
+            try:
+                if limiter: record = limiter.limit_call_and_input(self._count_input(i, messages)) # shared with all other users of the backend's API key
+                start = time.time()
+                for chunk in self.backends[i].stream(messages, stop=stop, **kwargs):
+                    if ttft is None: ttft = time.time() - start
+                    chunk = to_generation_chunk(chunk, run_manager)
+                    output += chunk.text
+                    yield chunk
+                if ttft is None: ttft = time.time() - start # empty response
+                return
+            except Exception as e:
+                error = e
+                if ttft is None and self._should_retry(i, e, tried): continue # nothing streamed yet, safe to switch
+                raise
+            finally:
+                self._release(i, ttft, error) # also when the caller closes the stream early
+                if record: limiter.set_output_tokens(tokens.get_tokenizer(self.backends[i])(output), record) # type: ignore
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        tried: set[int] = set()
+        while True:
+            i = self._acquire(tried)
+            if i is None:
+                await asyncio.sleep(0.05)
+                continue
+            tried.add(i)
+            limiter, record, output = rate_limiter.find_limiter(self.backends[i]), None, ""
+            ttft, error = None, None
+            try:
+                if limiter: record = await limiter.alimit_call_and_input(self._count_input(i, messages))
+                start = time.time()
+                async for chunk in self.backends[i].astream(messages, stop=stop, **kwargs):
+                    if ttft is None: ttft = time.time() - start
+                    chunk = to_generation_chunk(chunk)
+                    output += chunk.text
+                    if run_manager: await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                    yield chunk
+                if ttft is None: ttft = time.time() - start # empty response
+                return
+            except Exception as e:
+                error = e
+                if ttft is None and self._should_retry(i, e, tried): continue
+                raise
+            finally:
+                self._release(i, ttft, error) # cancellation is not counted as a backend failure
+                if record: limiter.set_output_tokens(tokens.get_tokenizer(self.backends[i])(output), record) # type: ignore
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        return merge_chunks(list(self._stream(messages, stop, run_manager, **kwargs)))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        return merge_chunks([chunk async for chunk in self._astream(messages, stop, run_manager, **kwargs)])
+
+
+def to_generation_chunk(chunk, run_manager=None) -> ChatGenerationChunk:
+    message = chunk if isinstance(chunk, BaseMessageChunk) else AIMessageChunk(content=str(chunk)) # completion models stream strings
+    generation = ChatGenerationChunk(message=message)
+    if run_manager: run_manager.on_llm_new_token(generation.text, chunk=generation)
+    return generation
+
+def merge_chunks(chunks: list[ChatGenerationChunk]) -> ChatResult:
+    merged = chunks[0] if chunks else ChatGenerationChunk(message=AIMessageChunk(content=""))
+    for chunk in chunks[1:]: merged += chunk
+    return ChatResult(generations=[ChatGeneration(message=message_chunk_to_message(merged.message))])
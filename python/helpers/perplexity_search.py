@@ -1,11 +1,17 @@
 
+from functools import cache
 from openai import OpenAI
+from python.helpers import http_pool
 import models
 
+@cache
+def get_client(api_key:str|None, base_url:str) -> OpenAI:
+    return OpenAI(api_key=api_key, base_url=base_url, http_client=http_pool.client()) # one client per endpoint, connections are kept alive
+
 def perplexity_search(query:str, model_name="llama-3.1-sonar-large-128k-online",api_key=None,base_url="https://api.perplexity.ai"):    
     api_key = api_key or models.get_api_key("perplexity")
 
-    client = OpenAI(api_key=api_key, base_url=base_url)
+    client = get_client(api_key, base_url)
         
     messages = [
     #It is recommended to use only single-turn conversations and avoid system prompts for the online LLMs (sonar-small-online and sonar-medium-online).
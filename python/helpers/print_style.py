@@ -1,11 +1,54 @@
-import os, webcolors, html
+import webcolors, html
 import sys
-from datetime import datetime
+from functools import cache
 from . import files
+from .log_writer import LogWriter
+
+ANSI_END = "\033[0m"  # Reset ANSI code
+
+@cache
+def get_rgb_color_code(color, is_background=False) -> tuple[str, str]:
+    try:
+        if color.startswith("#") and len(color) == 7:
+            r = int(color[1:3], 16)
+            g = int(color[3:5], 16)
+            b = int(color[5:7], 16)
+        else:
+            rgb_color = webcolors.name_to_rgb(color)
+            r, g, b = rgb_color.red, rgb_color.green, rgb_color.blue
+        
+        if is_background:
+            return f"\033[48;2;{r};{g};{b}m", f"background-color: rgb({r}, {g}, {b});"
+        else:
+            return f"\033[38;2;{r};{g};{b}m", f"color: rgb({r}, {g}, {b});"
+    except ValueError:
+        return "", ""
+
+@cache
+def compile_style(bold, italic, underline, font_color, background_color) -> tuple[str, str]:
+    # ANSI prefix and html span opener, built once per distinct style
+    start = ""
+    styles = []
+    if bold:
+        start += "\033[1m"
+        styles.append("font-weight: bold;")
+    if italic:
+        start += "\033[3m"
+        styles.append("font-style: italic;")
+    if underline:
+        start += "\033[4m"
+        styles.append("text-decoration: underline;")
+    font_color_code, font_color_style = get_rgb_color_code(font_color)
+    background_color_code, background_color_style = get_rgb_color_code(background_color, True)
+    start += font_color_code + background_color_code
+    styles += [font_color_style, background_color_style]
+    return start, f'<span style="{" ".join(styles)}">'
 
 class PrintStyle:
     last_endline = True
     log_file_path = None
+    log_writer: LogWriter | None = None # writes the html log in a background thread
+    log_enabled = True # html log sink, nothing is rendered for it when disabled
 
     def __init__(self, bold=False, italic=False, underline=False, font_color="default", background_color="default", padding=False, log_only=False):
         self.bold = bold
@@ -16,62 +59,23 @@ class PrintStyle:
         self.padding = padding
         self.padding_added = False  # Flag to track if padding was added
         self.log_only = log_only
+        self.ansi_start, self.html_start = compile_style(bold, italic, underline, font_color, background_color)
 
-        if PrintStyle.log_file_path is None:
-            logs_dir = files.get_abs_path("logs")
-            os.makedirs(logs_dir, exist_ok=True)
-            log_filename = datetime.now().strftime("log_%Y%m%d_%H%M%S.html")
-            PrintStyle.log_file_path = os.path.join(logs_dir, log_filename)
-            with open(PrintStyle.log_file_path, "w") as f:
-                f.write("<html><body style='background-color:black;font-family: Arial, Helvetica, sans-serif;'><pre>\n")
+        if PrintStyle.log_writer is None and PrintStyle.log_enabled:
+            PrintStyle.log_writer = LogWriter(files.get_abs_path("logs"), "log_%Y%m%d_%H%M%S.html",
+                header="<html><body style='background-color:black;font-family: Arial, Helvetica, sans-serif;'><pre>\n",
+                footer="</pre></body></html>")
+            PrintStyle.log_file_path = PrintStyle.log_writer.path
 
     def _get_rgb_color_code(self, color, is_background=False):
-        try:
-            if color.startswith("#") and len(color) == 7:
-                r = int(color[1:3], 16)
-                g = int(color[3:5], 16)
-                b = int(color[5:7], 16)
-            else:
-                rgb_color = webcolors.name_to_rgb(color)
-                r, g, b = rgb_color.red, rgb_color.green, rgb_color.blue
-            
-            if is_background:
-                return f"\033[48;2;{r};{g};{b}m", f"background-color: rgb({r}, {g}, {b});"
-            else:
-                return f"\033[38;2;{r};{g};{b}m", f"color: rgb({r}, {g}, {b});"
-        except ValueError:
-            return "", ""
+        return get_rgb_color_code(color, is_background)
 
     def _get_styled_text(self, text):
-        start = ""
-        end = "\033[0m"  # Reset ANSI code
-        if self.bold:
-            start += "\033[1m"
-        if self.italic:
-            start += "\033[3m"
-        if self.underline:
-            start += "\033[4m"
-        font_color_code, _ = self._get_rgb_color_code(self.font_color)
-        background_color_code, _ = self._get_rgb_color_code(self.background_color, True)
-        start += font_color_code
-        start += background_color_code
-        return start + text + end
+        return self.ansi_start + text + ANSI_END
 
     def _get_html_styled_text(self, text):
-        styles = []
-        if self.bold:
-            styles.append("font-weight: bold;")
-        if self.italic:
-            styles.append("font-style: italic;")
-        if self.underline:
-            styles.append("text-decoration: underline;")
-        _, font_color_code = self._get_rgb_color_code(self.font_color)
-        _, background_color_code = self._get_rgb_color_code(self.background_color, True)
-        styles.append(font_color_code)
-        styles.append(background_color_code)
-        style_attr = " ".join(styles)
         escaped_text = html.escape(text).replace("\n", "<br>")  # Escape HTML special characters
-        return f'<span style="{style_attr}">{escaped_text}</span>'
+        return self.html_start + escaped_text + "</span>"
 
     def _add_padding_if_needed(self):
         if self.padding and not self.padding_added:
@@ -81,14 +85,19 @@ class PrintStyle:
             self.padding_added = True
 
     def _log_html(self, html):
-        with open(PrintStyle.log_file_path, "a") as f: # type: ignore
-            f.write(html)
+        if PrintStyle.log_writer: PrintStyle.log_writer.write(html)
+
+    def _output(self, text: str, end: str, html_end: str):
+        # render only for the active sinks: console unless log_only, html log when enabled
+        if not self.log_only:
+            print(self.ansi_start + text + ANSI_END, end=end, flush=True)
+        if PrintStyle.log_writer:
+            self._log_html(self._get_html_styled_text(text) + html_end)
 
     @staticmethod
     def _close_html_log():
-        if PrintStyle.log_file_path:
-            with open(PrintStyle.log_file_path, "a") as f:
-                f.write("</pre></body></html>")            
+        if PrintStyle.log_writer:
+            PrintStyle.log_writer.close() # flushes the queue and closes the html
 
     def get(self, *args, sep=' ', **kwargs):
         text = sep.join(map(str, args))
@@ -99,18 +108,12 @@ class PrintStyle:
         if not PrintStyle.last_endline: 
             print()
             self._log_html("<br>")
-        plain_text, styled_text, html_text = self.get(*args, sep=sep, **kwargs)
-        if not self.log_only:
-            print(styled_text, end='\n', flush=True)
-        self._log_html(html_text+"<br>\n")
+        self._output(sep.join(map(str, args)), "\n", "<br>\n")
         PrintStyle.last_endline = True
 
     def stream(self, *args, sep=' ', **kwargs):
         self._add_padding_if_needed()
-        plain_text, styled_text, html_text = self.get(*args, sep=sep, **kwargs)
-        if not self.log_only:
-            print(styled_text, end='', flush=True)
-        self._log_html(html_text)
+        self._output(sep.join(map(str, args)), "", "")
         PrintStyle.last_endline = False
 
     def is_last_line_empty(self):
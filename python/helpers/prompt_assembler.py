@@ -0,0 +1,32 @@
+from langchain_core.messages import BaseMessage, SystemMessage
+from .tokens import Tokenizer, approximate_tokens
+
+class PromptAssembler:
+    def __init__(self, system_prefix: str, tokenizer: Tokenizer = approximate_tokens):
+        self.tokenizer = tokenizer
+        self.system_prefix = system_prefix # static system and tools prompt, built once per agent
+        self.system_prefix_tokens = tokenizer(system_prefix)
+        self.system_extra = ""
+        self.system_tokens = self.system_prefix_tokens
+        self.system_message = SystemMessage(content=system_prefix)
+        self.messages: list[BaseMessage] = [self.system_message]
+        self._history: list[BaseMessage] | None = None # history list the cached messages were built from
+        self._history_len = 0
+
+    def set_system_extra(self, extra: str):
+        # rebuild the system message only when the dynamic part (memories) changes
+        if extra == self.system_extra: return
+        self.system_extra = extra
+        content = self.system_prefix + "\n\n" + extra if extra else self.system_prefix
+        self.system_message = SystemMessage(content=content)
+        self.system_tokens = self.system_prefix_tokens + (self.tokenizer("\n\n" + extra) if extra else 0)
+        self.messages[0] = self.system_message
+
+    def assemble(self, history: list[BaseMessage]) -> list[BaseMessage]:
+        if history is self._history and len(history) >= self._history_len:
+            self.messages.extend(history[self._history_len:]) # only append the new delta, concatenated messages are the same objects
+        else:
+            self.messages[1:] = history # history was replaced (cleanup), rebuild from scratch
+        self._history = history
+        self._history_len = len(history)
+        return self.messages
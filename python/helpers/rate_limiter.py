@@ -1,14 +1,18 @@
-import time
+import asyncio, hashlib, re, threading, time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
 from collections import deque
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import Any, Callable, Tuple
 from .print_style import PrintStyle
+from . import http_pool, trace
 
 @dataclass
 class CallRecord:
     timestamp: float
     input_tokens: int
     output_tokens: int = 0  # Default to 0, will be set separately
+    expired: bool = False # left the window, no longer part of the totals
 
 class RateLimiter:
     def __init__(self, max_calls: int, max_input_tokens: int, max_output_tokens: int, window_seconds: int = 60):
@@ -17,52 +21,222 @@ class RateLimiter:
         self.max_output_tokens = max_output_tokens
         self.window_seconds = window_seconds
         self.call_records: deque = deque()
+        self.input_tokens = 0 # running totals of the records in the window
+        self.output_tokens = 0
+        self.lock = threading.Lock() # shared by agents in the event loop and in worker threads
+        self.waiters: set[Callable[[], None]] = set() # wake up callbacks of blocked callers
+        self.adaptive = True # while provider headers are fresh, they replace the static limits
+        self.provider_updated = 0.0
+        self.provider_requests: int | None = None # remaining until the reset time, counted down locally between responses
+        self.provider_requests_reset = 0.0
+        self.provider_tokens: int | None = None
+        self.provider_tokens_reset = 0.0
+        self.blocked_until = 0.0 # retry-after of a rejected call
+
+    def configure(self, max_calls: int, max_input_tokens: int, max_output_tokens: int, window_seconds: int, adaptive: bool = True):
+        with self.lock:
+            changed = (max_calls, max_input_tokens, max_output_tokens, window_seconds, adaptive) != (self.max_calls, self.max_input_tokens, self.max_output_tokens, self.window_seconds, self.adaptive)
+            self.max_calls, self.max_input_tokens, self.max_output_tokens, self.window_seconds, self.adaptive = max_calls, max_input_tokens, max_output_tokens, window_seconds, adaptive
+            if changed: self._notify()
+        return self
+
+    def update_from_provider(self, remaining_requests: int | None = None, requests_reset: float | None = None, remaining_tokens: int | None = None, tokens_reset: float | None = None, retry_at: float | None = None):
+        # absolute reset times, parsed from the rate limit headers of a response
+        with self.lock:
+            now = time.time()
+            if remaining_requests is not None or remaining_tokens is not None: self.provider_updated = now
+            if remaining_requests is not None: self.provider_requests, self.provider_requests_reset = remaining_requests, requests_reset or now + 1
+            if remaining_tokens is not None: self.provider_tokens, self.provider_tokens_reset = remaining_tokens, tokens_reset or now + 1
+            if retry_at: self.blocked_until = max(self.blocked_until, retry_at)
+            self._notify() # the budget may have grown
+
+    def _notify(self):
+        for wake in list(self.waiters): wake() # waiters check the limits again
 
     def _clean_old_records(self, current_time: float):
         while self.call_records and current_time - self.call_records[0].timestamp > self.window_seconds:
-            self.call_records.popleft()
+            record = self.call_records.popleft()
+            record.expired = True
+            self.input_tokens -= record.input_tokens
+            self.output_tokens -= record.output_tokens
 
     def _get_counts(self) -> Tuple[int, int, int]:
-        calls = len(self.call_records)
-        input_tokens = sum(record.input_tokens for record in self.call_records)
-        output_tokens = sum(record.output_tokens for record in self.call_records)
-        return calls, input_tokens, output_tokens
+        return len(self.call_records), self.input_tokens, self.output_tokens
 
-    def _wait_if_needed(self, current_time: float, new_input_tokens: int):
-        while True:
-            self._clean_old_records(current_time)
-            calls, input_tokens, output_tokens = self._get_counts()
-            
-            wait_reasons = []
-            if self.max_calls > 0 and calls >= self.max_calls:
-                wait_reasons.append("max calls")
-            if self.max_input_tokens > 0 and input_tokens + new_input_tokens > self.max_input_tokens:
-                wait_reasons.append("max input tokens")
-            if self.max_output_tokens > 0 and output_tokens >= self.max_output_tokens:
-                wait_reasons.append("max output tokens")
-            
-            if not wait_reasons:
-                break
-            
-            oldest_record = self.call_records[0]
-            wait_time = oldest_record.timestamp + self.window_seconds - current_time
-            if wait_time > 0:
-                PrintStyle(font_color="yellow", padding=True).print(f"Rate limit exceeded. Waiting for {wait_time:.2f} seconds due to: {', '.join(wait_reasons)}")
-                time.sleep(wait_time)
-            current_time = time.time()
+    def _get_provider_wait(self, current_time: float, new_input_tokens: int) -> tuple[float, str]:
+        if self.provider_requests is not None and current_time >= self.provider_requests_reset: self.provider_requests = None # budget was reset
+        if self.provider_tokens is not None and current_time >= self.provider_tokens_reset: self.provider_tokens = None
+        if self.blocked_until > current_time: return self.blocked_until - current_time, "provider retry-after"
+        if self.provider_requests is not None and self.provider_requests <= 0: return self.provider_requests_reset - current_time, "provider requests"
+        if self.provider_tokens is not None and new_input_tokens > self.provider_tokens: return self.provider_tokens_reset - current_time, "provider tokens"
+        return 0, ""
 
-    def limit_call_and_input(self, input_token_count: int) -> CallRecord:
+    def _get_wait_time(self, current_time: float, new_input_tokens: int) -> float:
+        self._clean_old_records(current_time)
+        calls, input_tokens, output_tokens = self._get_counts()
+
+        # pause exactly until the provider resets its budget
+        wait_time, reason = self._get_provider_wait(current_time, new_input_tokens)
+        if wait_time > 0:
+            PrintStyle(font_color="yellow", padding=True).print(f"Rate limit exceeded. Waiting for {wait_time:.2f} seconds due to: {reason}")
+            return wait_time
+        if self.adaptive and current_time - self.provider_updated < self.window_seconds: return 0 # provider reports the real limits
+        
+        wait_reasons = []
+        if self.max_calls > 0 and calls >= self.max_calls:
+            wait_reasons.append("max calls")
+        if self.max_input_tokens > 0 and input_tokens + new_input_tokens > self.max_input_tokens:
+            wait_reasons.append("max input tokens")
+        if self.max_output_tokens > 0 and output_tokens >= self.max_output_tokens:
+            wait_reasons.append("max output tokens")
+        
+        if not wait_reasons or not self.call_records:
+            return 0
+        
+        oldest_record = self.call_records[0]
+        wait_time = oldest_record.timestamp + self.window_seconds - current_time
+        if wait_time > 0:
+            PrintStyle(font_color="yellow", padding=True).print(f"Rate limit exceeded. Waiting for {wait_time:.2f} seconds due to: {', '.join(wait_reasons)}")
+        return max(wait_time, 0.001) # the oldest record leaves the window right after its timestamp
+
+    def _try_add_record(self, new_input_tokens: int) -> tuple[CallRecord | None, float]:
         current_time = time.time()
-        self._wait_if_needed(current_time, input_token_count)
-        new_record = CallRecord(current_time, input_token_count)
-        self.call_records.append(new_record)
-        return new_record
-
-    def set_output_tokens(self, output_token_count: int):
-        if self.call_records:
-            self.call_records[-1].output_tokens += output_token_count
+        wait_time = self._get_wait_time(current_time, new_input_tokens)
+        if wait_time: return None, wait_time
+        record = CallRecord(current_time, new_input_tokens)
+        self.call_records.append(record)
+        self.input_tokens += new_input_tokens
+        if self.provider_requests is not None: self.provider_requests -= 1 # until the response of this call updates it
+        if self.provider_tokens is not None: self.provider_tokens -= new_input_tokens
+        return record, 0
+
+    def limit_call_and_input(self, input_token_count: int) -> CallRecord:
+        event = threading.Event()
+        start = 0.0 # of the first wait
+        while True:
+            with self.lock:
+                record, wait_time = self._try_add_record(input_token_count)
+                if record: return self._trace_wait(record, start)
+                event.clear()
+                self.waiters.add(event.set)
+                start = start or time.time()
+            try: event.wait(wait_time) # until the oldest record expires or the limits change
+            finally:
+                with self.lock: self.waiters.discard(event.set)
+
+    async def alimit_call_and_input(self, input_token_count: int) -> CallRecord:
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        wake = lambda: loop.call_soon_threadsafe(event.set) # can be notified from another thread
+        start = 0.0 # of the first wait
+        while True:
+            with self.lock:
+                record, wait_time = self._try_add_record(input_token_count)
+                if record: return self._trace_wait(record, start)
+                event.clear()
+                self.waiters.add(wake)
+                start = start or time.time()
+            try: await asyncio.wait_for(event.wait(), wait_time)
+            except asyncio.TimeoutError: pass
+            finally:
+                with self.lock: self.waiters.discard(wake)
+
+    def _trace_wait(self, record: CallRecord, start: float) -> CallRecord:
+        if start: trace.event("rate_limit_wait", start=start, end=record.timestamp, input_tokens=record.input_tokens) # only calls that waited
+        return record
+
+    def set_output_tokens(self, output_token_count: int, record: CallRecord | None = None):
+        # a shared limiter has calls of other agents after this one, pass the record returned for the call
+        with self.lock:
+            record = record or (self.call_records[-1] if self.call_records else None)
+            if record:
+                record.output_tokens += output_token_count
+                if not record.expired: self.output_tokens += output_token_count
         return self
 
+
+# limiters shared per provider and API key, so all agents of the process respect the same provider limit
+_limiters: dict[str, RateLimiter] = {}
+_keys: dict[int, tuple[Any, str]] = {} # registered by the factories in models.py, keyed by id with the model kept alive
+_by_api_key: dict[str, list[RateLimiter]] = {} # api key hash -> limiters, to route response headers
+_registry_lock = threading.Lock()
+
+def hash_api_key(api_key) -> str:
+    return hashlib.sha256(str(api_key).encode()).hexdigest()[:16] # the key itself is not kept
+
+def register_limit_key(model, provider: str, api_key: str | None = None):
+    _keys[id(model)] = (model, f"{provider}:{hash_api_key(api_key)}")
+    return model
+
+def get_limiter(model, max_calls: int, max_input_tokens: int, max_output_tokens: int, window_seconds: int = 60, adaptive: bool = True) -> RateLimiter:
+    # models without a registered key are limited per model object, limits are those of the latest agent asking
+    if backends := getattr(model, "backends", None): # model router: the limits apply to the shared limiter of each backend, used by the router per call
+        for backend in backends: get_limiter(backend, max_calls, max_input_tokens, max_output_tokens, window_seconds, adaptive)
+        max_calls = max_input_tokens = max_output_tokens = 0 # the router's own limiter only counts
+    with _registry_lock:
+        key = _keys.setdefault(id(model), (model, f"model:{id(model)}"))[1]
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(max_calls, max_input_tokens, max_output_tokens, window_seconds)
+            _by_api_key.setdefault(key.split(":", 1)[1], []).append(_limiters[key])
+        limiter = _limiters[key]
+    return limiter.configure(max_calls, max_input_tokens, max_output_tokens, window_seconds, adaptive)
+
+def find_limiter(model) -> RateLimiter | None:
+    # the limiter already configured for a model, None if no agent uses it yet
+    with _registry_lock:
+        key = _keys.get(id(model), (None, f"model:{id(model)}"))[1]
+        return _limiters.get(key)
+
+
+# provider rate limit headers, read from every response of the shared HTTP pool
+REMAINING_REQUESTS = ("x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining")
+RESET_REQUESTS = ("x-ratelimit-reset-requests", "anthropic-ratelimit-requests-reset")
+REMAINING_TOKENS = ("x-ratelimit-remaining-tokens", "anthropic-ratelimit-input-tokens-remaining", "anthropic-ratelimit-tokens-remaining")
+RESET_TOKENS = ("x-ratelimit-reset-tokens", "anthropic-ratelimit-input-tokens-reset", "anthropic-ratelimit-tokens-reset")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def parse_reset(value: str | None, now: float) -> float | None:
+    # seconds, a duration like "6m0s" or "20ms" (OpenAI, Groq) or a timestamp (Anthropic), returned as absolute time
+    if not value: return None
+    try: return now + float(value)
+    except ValueError: pass
+    if parts := re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value): return now + sum(float(n) * DURATION_UNITS[unit] for n, unit in parts)
+    try: return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError: pass
+    try: return parsedate_to_datetime(value).timestamp() # retry-after as an HTTP date
+    except (TypeError, ValueError): return None
+
+def parse_int(value: str | None) -> int | None:
+    try: return int(float(value)) if value is not None else None
+    except ValueError: return None
+
+def first_header(headers, names: tuple[str, ...]) -> str | None:
+    return next((headers[name] for name in names if name in headers), None)
+
+def ingest_response(response):
+    headers = response.headers
+    if not any(name.startswith(("x-ratelimit-", "anthropic-ratelimit-", "retry-after")) for name in headers): return
+    request_headers = response.request.headers
+    api_key = request_headers.get("x-api-key") or request_headers.get("api-key") or request_headers.get("authorization", "").removeprefix("Bearer ")
+    limiters = _by_api_key.get(hash_api_key(api_key))
+    if not limiters: return
+
+    now = time.time()
+    retry_at = None
+    if "retry-after-ms" in headers: retry_at = now + (parse_int(headers["retry-after-ms"]) or 0) / 1000
+    elif "retry-after" in headers: retry_at = parse_reset(headers["retry-after"], now)
+    if response.status_code == 429 and not retry_at: retry_at = parse_reset(first_header(headers, RESET_REQUESTS + RESET_TOKENS), now)
+
+    for limiter in limiters:
+        limiter.update_from_provider(
+            remaining_requests=parse_int(first_header(headers, REMAINING_REQUESTS)),
+            requests_reset=parse_reset(first_header(headers, RESET_REQUESTS), now),
+            remaining_tokens=parse_int(first_header(headers, REMAINING_TOKENS)),
+            tokens_reset=parse_reset(first_header(headers, RESET_TOKENS), now),
+            retry_at=retry_at if response.status_code in (429, 503) else None)
+
+http_pool.response_hooks.append(ingest_response)
+
 # Example usage
 rate_limiter = RateLimiter(max_calls=5, max_input_tokens=1000, max_output_tokens=2000)
 
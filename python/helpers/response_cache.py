@@ -0,0 +1,65 @@
+import hashlib, json, os, sqlite3, threading, time
+from . import files
+
+# persistent cache of utility model responses, least recently used entries are evicted over the size limit
+
+class ResponseCache:
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock() # one connection shared by the event loop and worker threads
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, size INTEGER, accessed REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.db.commit()
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> str | None:
+        with self.lock:
+            row = self.db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None: return None
+            self.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+            return row[0]
+
+    def set(self, key: str, response: str):
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes: return
+        with self.lock:
+            old = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, response, size, time.time()))
+            self.size += size - (old[0] if old else 0)
+            while self.size > self.max_bytes: # evict least recently used
+                rows = self.db.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 16").fetchall()
+                if not rows: self.size = 0; break
+                self.db.executemany("DELETE FROM responses WHERE key = ?", [(row[0],) for row in rows])
+                self.size -= sum(row[1] for row in rows)
+            self.db.commit()
+
+
+def model_identity(model) -> str:
+    # class and identifying parameters (model name, temperature...), so different models never share entries
+    try: params = model._identifying_params
+    except Exception: params = {}
+    return type(model).__name__ + json.dumps(params, sort_keys=True, default=str)
+
+def is_deterministic(model) -> bool:
+    # only an explicit temperature of 0 is cached, a missing or default (None) one samples, a router can pick any backend
+    if backends := getattr(model, "backends", None): return all(is_deterministic(backend) for backend in backends)
+    return getattr(model, "temperature", None) == 0
+
+def get_key(model, system: str, msg: str) -> str:
+    return hashlib.sha256("\0".join((model_identity(model), system, msg)).encode("utf-8")).hexdigest()
+
+
+_caches: dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+def get_cache(max_mb: float, path: str = "cache/adhoc_responses.db") -> ResponseCache:
+    abs_path = files.get_abs_path(path)
+    with _caches_lock:
+        if abs_path not in _caches: _caches[abs_path] = ResponseCache(abs_path, int(max_mb * 1024 * 1024))
+        cache = _caches[abs_path]
+        cache.max_bytes = int(max_mb * 1024 * 1024)
+        return cache
@@ -0,0 +1,69 @@
+import asyncio, dataclasses, os, re
+from agent import Agent, AgentConfig, AgentContext
+from python.helpers import files, checkpoint
+
+ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}") # ids name folders and checkpoint files, no path separators or dots
+
+def valid_id(id: str) -> bool:
+    return bool(ID_PATTERN.fullmatch(id))
+
+class Session:
+    def __init__(self, config: AgentConfig, context: AgentContext):
+        self.context = context
+        self.agent = checkpoint.resume(context.id, config, context) or Agent(0, config, context) # continue a checkpointed conversation
+        self.lock = asyncio.Lock() # one message loop at a time per conversation
+        self.task: asyncio.Task | None = None
+
+    @property
+    def busy(self) -> bool:
+        return self.lock.locked()
+
+    async def send(self, message: str) -> str:
+        async with self.lock:
+            self.task = asyncio.create_task(self.agent.amessage_loop(message))
+            try: return await self.task
+            finally: self.task = None
+
+    def intervene(self, message: str):
+        if self.context.streaming_agent: self.context.streaming_agent.intervention_message = message
+
+    async def aclose(self):
+        if self.task: self.task.cancel() # on the event loop, tasks cannot be cancelled from other threads
+        await asyncio.to_thread(self.close)
+
+    def close(self):
+        # blocking part of closing, the running message loop is cancelled by aclose
+        self.agent.close_shells()
+        if self.context.checkpoint: self.context.checkpoint.close()
+
+
+class SessionHost:
+    def __init__(self, config: AgentConfig, max_sessions: int = 0, shared_memory: bool = False):
+        self.config = config
+        self.max_sessions = max_sessions # 0 = unlimited
+        self.shared_memory = shared_memory # all sessions recall from the configured memory subdir
+        self.sessions: dict[str, Session] = {}
+
+    def create(self, id: str = "") -> Session:
+        if id and not valid_id(id): raise ValueError("Session id must be 1-64 letters, digits, '-' or '_'")
+        if id in self.sessions: raise ValueError(f"Session {id} already exists")
+        if self.max_sessions and len(self.sessions) >= self.max_sessions: raise ValueError(f"Session limit of {self.max_sessions} reached")
+        context = AgentContext(id)
+        context.work_dir = files.get_abs_path("work_dir", "sessions", context.id)
+        os.makedirs(context.work_dir, exist_ok=True)
+        config = self.config if self.shared_memory else dataclasses.replace(self.config, memory_subdir=os.path.join(self.config.memory_subdir, "sessions", context.id))
+        session = Session(config, context)
+        self.sessions[context.id] = session
+        return session
+
+    def get(self, id: str) -> Session | None:
+        return self.sessions.get(id)
+
+    async def aclose(self, id: str) -> bool:
+        session = self.sessions.pop(id, None)
+        if not session: return False
+        await session.aclose()
+        return True
+
+    async def aclose_all(self):
+        await asyncio.gather(*[self.aclose(id) for id in list(self.sessions)])
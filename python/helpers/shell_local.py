@@ -5,7 +5,8 @@ import sys
 from typing import Optional, Tuple
 
 class LocalInteractiveSession:
-    def __init__(self):
+    def __init__(self, cwd: str | None = None):
+        self.cwd = cwd
         self.process = None
         self.full_output = ''
 
@@ -15,6 +16,7 @@ class LocalInteractiveSession:
             # Windows
             self.process = subprocess.Popen(
                 ['cmd.exe'],
+                cwd=self.cwd,
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
@@ -25,6 +27,7 @@ class LocalInteractiveSession:
             # macOS and Linux
             self.process = subprocess.Popen(
                 ['/bin/bash'],
+                cwd=self.cwd,
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
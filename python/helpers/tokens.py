@@ -0,0 +1,67 @@
+from functools import cache
+from typing import Any, Callable
+from langchain_core.messages import BaseMessage
+
+Tokenizer = Callable[[str], int]
+
+# tokenizers registered per model instance by the factories in models.py, keyed by id with the model kept alive
+_tokenizers: dict[int, tuple[Any, Tokenizer]] = {}
+
+def approximate_tokens(text: str) -> int:
+    return int(len(text)/4)
+
+def tiktoken_tokenizer(model_name: str, fallback_encoding: str = "cl100k_base") -> Tokenizer:
+    @cache
+    def get_encoding():
+        # resolved on first use, so creating a model never downloads encoding files
+        try:
+            import tiktoken
+            try: return tiktoken.encoding_for_model(model_name)
+            except KeyError: return tiktoken.get_encoding(fallback_encoding)
+        except Exception: return None
+
+    def count(text: str) -> int:
+        encoding = get_encoding()
+        if encoding is None: return approximate_tokens(text)
+        return len(encoding.encode(text, disallowed_special=()))
+    return count
+
+def register_tokenizer(model, tokenizer: Tokenizer):
+    _tokenizers[id(model)] = (model, tokenizer)
+    return model
+
+def get_tokenizer(model) -> Tokenizer:
+    entry = _tokenizers.get(id(model))
+    return entry[1] if entry else approximate_tokens
+
+
+class TokenLedger:
+    def __init__(self, tokenizer: Tokenizer):
+        self.tokenizer = tokenizer
+        self.counts: dict[int, tuple[BaseMessage, int]] = {} # token count cached per message, message kept so its id stays unique
+        self.total = 0
+
+    def count(self, text: str) -> int:
+        return self.tokenizer(text)
+
+    def add(self, msg: BaseMessage) -> int:
+        tokens = self.count(str(msg.content))
+        self.counts[id(msg)] = (msg, tokens)
+        self.total += tokens
+        return tokens
+
+    def extend(self, msg: BaseMessage, text: str) -> int:
+        # content was concatenated to an already counted message, only count the new part
+        if id(msg) not in self.counts: return self.add(msg)
+        tokens = self.count(text)
+        self.counts[id(msg)] = (msg, self.counts[id(msg)][1] + tokens)
+        self.total += tokens
+        return tokens
+
+    def sync(self, history: list[BaseMessage]):
+        # history was replaced, drop removed messages and count only the new ones
+        ids = {id(msg) for msg in history}
+        for key in [key for key in self.counts if key not in ids]:
+            self.total -= self.counts.pop(key)[1]
+        for msg in history:
+            if id(msg) not in self.counts: self.add(msg)
@@ -1,3 +1,4 @@
+import asyncio
 from abc import abstractmethod
 from typing import TypedDict
 from agent import Agent
@@ -11,6 +12,11 @@ class Response:
     
 class Tool:
 
+    speculative = False # tool can be started while the rest of the agent message is still streaming
+    parallel = True # tool can run alongside other tool calls of the same message
+    side_effects = False # tool changes something outside the agent, never started before its message is accepted
+    final = False # tool ends the message loop, so no history compaction or memory prefetch is started for a next prompt
+
     def __init__(self, agent: Agent, name: str, args: dict[str,str], message: str, **kwargs) -> None:
         self.agent = agent
         self.name = name
@@ -21,8 +27,11 @@ class Tool:
     def execute(self,**kwargs) -> Response:
         pass
 
+    async def aexecute(self,**kwargs) -> Response:
+        return await asyncio.to_thread(self.execute, **kwargs) # blocking tools run in a worker thread, async tools override this
+
     def before_execution(self, **kwargs):
-        if self.agent.handle_intervention(): return # wait for intervention and handle it, if paused
+        # hooks run on the event loop and must not block, the agent handles pauses and interventions around them
         PrintStyle(font_color="#1B4F72", padding=True, background_color="white", bold=True).print(f"{self.agent.agent_name}: Using tool '{self.name}':")
         if self.args and isinstance(self.args, dict):
             for key, value in self.args.items():
@@ -33,7 +42,6 @@ class Tool:
     def after_execution(self, response: Response, **kwargs):
         text = messages.truncate_text(response.message.strip(), self.agent.config.max_tool_response_length)
         msg_response = files.read_file("./prompts/fw.tool_response.md", tool_name=self.name, tool_response=text)
-        if self.agent.handle_intervention(): return # wait for intervention and handle it, if paused
         self.agent.append_message(msg_response, human=True)
         PrintStyle(font_color="#1B4F72", background_color="white", padding=True, bold=True).print(f"{self.agent.agent_name}: Response from tool '{self.name}':")
         PrintStyle(font_color="#85C1E9").print(response.message)
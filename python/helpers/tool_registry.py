@@ -0,0 +1,52 @@
+import importlib, inspect, os, sys, threading
+from types import ModuleType
+from . import files
+
+class ToolRegistry:
+    def __init__(self, directory: str = "python/tools", package: str = "python.tools"):
+        self.directory = directory
+        self.package = package
+        self.paths: dict[str, str] = {} # tool name -> module file
+        self.modules: dict[str, ModuleType] = {} # imported on first use
+        self.classes: dict[str, type] = {}
+        self.mtimes: dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.scan()
+
+    def scan(self):
+        abs_dir = files.get_abs_path(self.directory)
+        self.paths = { os.path.splitext(file)[0]: os.path.join(abs_dir, file) for file in os.listdir(abs_dir) if file.endswith(".py") and not file.startswith("__") }
+
+    def has(self, name: str) -> bool:
+        return name in self.paths
+
+    def get(self, name: str, hot_reload=False) -> type | None:
+        if name not in self.paths: return None
+        with self.lock: # tools can be resolved from worker threads
+            if name in self.classes and hot_reload and self._get_mtime(name) != self.mtimes.get(name):
+                self._load(name, reload=True)
+            elif name not in self.classes:
+                self._load(name)
+            return self.classes.get(name)
+
+    def _get_mtime(self, name: str) -> float:
+        try: return os.path.getmtime(self.paths[name])
+        except OSError: return 0
+
+    def _load(self, name: str, reload=False):
+        from python.helpers.tool import Tool
+
+        self.mtimes[name] = self._get_mtime(name)
+        if reload: sys.modules.pop(self.modules[name].__name__, None) # import again into a fresh namespace
+        module = importlib.import_module(f"{self.package}.{name}")  # Import the module
+        self.modules[name] = module
+
+        self.classes.pop(name, None)
+        class_list = inspect.getmembers(module, inspect.isclass)  # Get all classes in the module
+        for cls in class_list:
+            if cls[1] is not Tool and issubclass(cls[1], Tool):
+                self.classes[name] = cls[1]
+                break
+
+# tools are scanned once at startup, modules are imported lazily
+tools = ToolRegistry()
@@ -0,0 +1,78 @@
+import atexit, contextlib, contextvars, itertools, json, os, threading, time
+from typing import Any
+from . import files
+from .log_writer import LogWriter
+
+# Structured trace of agent steps, one JSON object per line in logs/trace_*.jsonl.
+# Spans nest through a context variable, so memory fetches, rate limit waits and tool calls
+# reference the span they run in, also across asyncio tasks and worker threads.
+
+enabled = os.getenv("TRACE", "").lower() in ("1", "true", "yes")
+writer: LogWriter | None = None
+listeners: list = [] # called with every finished span, e.g. to aggregate metrics
+
+_current: contextvars.ContextVar[dict | None] = contextvars.ContextVar("trace_span", default=None)
+_ids = itertools.count(1)
+_lock = threading.Lock()
+
+
+def active() -> bool:
+    return enabled or bool(listeners)
+
+def get_writer() -> LogWriter:
+    global writer
+    with _lock:
+        if writer is None: writer = LogWriter(files.get_abs_path("logs"), "trace_%Y%m%d_%H%M%S.jsonl")
+        return writer
+
+def close():
+    # writes the queued spans before the interpreter exits, the writer thread is a daemon
+    if writer: writer.close()
+
+def agent_info(agent) -> dict:
+    superior = agent.get_data("superior")
+    return {"agent": agent.agent_name, "parent_agent": superior.agent_name if superior else None, "context": agent.context.id}
+
+def event(name: str, agent=None, start: float | None = None, end: float | None = None, **attrs: Any):
+    # a finished span, for steps measured without the span context manager
+    if not active(): return
+    end = end or time.time()
+    start = start or end
+    parent = _current.get()
+    record = {"span": name, "id": next(_ids), "parent_span": parent["id"] if parent else None}
+    record.update(agent_info(agent) if agent else {key: parent.get(key) for key in ("agent", "parent_agent", "context")} if parent else {})
+    record.update(start=start, end=end, duration=round(end - start, 6), **attrs)
+    finish(record)
+
+@contextlib.contextmanager
+def span(name: str, agent=None, **attrs: Any):
+    # yields a dict to add attributes to (token counts, byte sizes...), written when the block exits
+    if not active():
+        yield attrs
+        return
+    parent = _current.get()
+    record = {"span": name, "id": next(_ids), "parent_span": parent["id"] if parent else None}
+    record.update(agent_info(agent) if agent else {key: parent.get(key) for key in ("agent", "parent_agent", "context")} if parent else {})
+    token = _current.set(record)
+    start = time.time()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        end = time.time()
+        try: _current.reset(token)
+        except ValueError: _current.set(parent) # exited in another context, e.g. a closed async generator
+        record.update(start=start, end=end, duration=round(end - start, 6), **attrs)
+        finish(record)
+
+def finish(record: dict):
+    for listener in listeners: listener(record)
+    if enabled: get_writer().write(json.dumps(record, default=str) + "\n")
+
+def text_bytes(*texts) -> int:
+    if not active(): return 0 # only measured while tracing
+    return sum(len(str(text).encode("utf-8")) for text in texts)
+
+atexit.register(close)
@@ -1,15 +1,59 @@
+import asyncio
 from agent import Agent
 from python.helpers.tool import Tool, Response
-from python.helpers import files
+from python.helpers import files, errors
 from python.helpers.print_style import PrintStyle
 
 class Delegation(Tool):
 
+    parallel = False # calls share one subordinate agent
+
     def execute(self, message="", reset="", **kwargs):
+        return asyncio.run(self.aexecute(message, reset, **kwargs))
+
+    async def aexecute(self, message="", reset="", tasks=None, **kwargs):
+        if tasks: return Response(message=await self.fan_out(tasks, reset), break_loop=False)
         # create subordinate agent using the data object on this agent and set superior agent to his data object
         if self.agent.get_data("subordinate") is None or str(reset).lower().strip() == "true":
-            subordinate = Agent(self.agent.number+1, self.agent.config)
-            subordinate.set_data("superior", self.agent)
+            subordinate = self.create_subordinate()
             self.agent.set_data("subordinate", subordinate) 
         # run subordinate agent message loop
-        return Response( message=self.agent.get_data("subordinate").message_loop(message), break_loop=False)
\ No newline at end of file
+        return Response( message=await self.agent.get_data("subordinate").amessage_loop(message), break_loop=False)
+
+    def create_subordinate(self, name: str = "") -> Agent:
+        subordinate = Agent(self.agent.number+1, self.agent.config, self.agent.context, name)
+        subordinate.set_data("superior", self.agent)
+        if self.agent.get_data("pooled"): subordinate.set_data("pooled", True) # part of a fan out, also leaves interventions to the fanning agent
+        return subordinate
+
+    def create_pooled(self, index: int) -> Agent:
+        subordinate = self.create_subordinate(f"Agent {self.agent.number+1}.{index+1}") # same depth, distinct names
+        subordinate.set_data("pooled", True)
+        return subordinate
+
+    async def fan_out(self, tasks: list[str] | str, reset="") -> str:
+        # independent subtasks run on a pool of subordinates, the one at each position is kept for followups.
+        # Pooled subordinates do not take over interventions, the user talks to this agent while they run.
+        if isinstance(tasks, str): tasks = [tasks]
+        previous: list[Agent | None] = [] if str(reset).lower().strip() == "true" else self.agent.get_data("subordinates") or []
+        pool = [previous[i] if i < len(previous) and previous[i] else self.create_pooled(i) for i in range(max(len(previous), len(tasks)))] # timed out positions start over
+        self.agent.set_data("subordinates", pool)
+
+        semaphore = asyncio.Semaphore(max(1, self.agent.config.subordinate_max_parallel))
+        timeout = self.agent.config.subordinate_timeout_seconds or None
+
+        async def run(subordinate: Agent, task: str) -> str:
+            async with semaphore:
+                try: return await asyncio.wait_for(subordinate.amessage_loop(str(task)), timeout)
+                except asyncio.TimeoutError:
+                    timed_out.append(subordinate)
+                    return files.read_file("./prompts/fw.subordinate_timeout.md", timeout=timeout)
+                except Exception as e: return files.read_file("./prompts/fw.error.md", error=errors.format_error(e))
+
+        timed_out: list[Agent] = []
+        results = await asyncio.gather(*[run(subordinate, task) for subordinate, task in zip(pool, tasks)])
+        if timed_out: # a cancelled loop can leave a shell command running in its worker thread and a dangling history
+            self.agent.set_data("subordinates", [None if subordinate in timed_out else subordinate for subordinate in pool])
+            for subordinate in timed_out: await asyncio.to_thread(subordinate.close_shells)
+        PrintStyle(font_color="#1B4F72", padding=True).print(f"{self.agent.agent_name}: {len(results)} subtasks finished")
+        return "\n\n".join(files.read_file("./prompts/fw.msg_from_subordinate.md", name=f"{subordinate.agent_name} (subtask {i+1})", message=result) for i, (subordinate, result) in enumerate(zip(pool, results)))
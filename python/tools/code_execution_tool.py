@@ -1,9 +1,9 @@
 from dataclasses import dataclass
-import os, json, contextlib, subprocess, ast, shlex
+import os, json, contextlib, subprocess, ast, shlex, posixpath
 from io import StringIO
 import time
 from typing import Literal
-from python.helpers import files, messages
+from python.helpers import files, messages, trace
 from agent import Agent
 from python.helpers.tool import Tool, Response
 from python.helpers import files
@@ -20,9 +20,12 @@ class State:
 
 class CodeExecution(Tool):
 
+    parallel = False # calls share one shell session
+    side_effects = True
+
     def execute(self,**kwargs):
 
-        if self.agent.handle_intervention(): return Response(message="", break_loop=False)  # wait for intervention and handle it, if paused
+        if self.agent.wait_if_paused(): return Response(message="", break_loop=False)  # wait if paused, the agent handles the intervention
         
         self.prepare_state()
 
@@ -60,12 +63,29 @@ class CodeExecution(Tool):
             #initialize local or remote interactive shell insterface
             if self.agent.config.code_exec_ssh_enabled:
                 shell = SSHInteractiveSession(self.agent.config.code_exec_ssh_addr,self.agent.config.code_exec_ssh_port,self.agent.config.code_exec_ssh_user,self.agent.config.code_exec_ssh_pass)
-            else: shell = LocalInteractiveSession()
+            else: shell = LocalInteractiveSession(cwd=self.agent.context.work_dir)
                 
             self.state = State(shell=shell,docker=docker)
             shell.connect()
+            if self.agent.config.code_exec_ssh_enabled and (remote_dir := self.get_remote_work_dir()): self.change_directory(shell, remote_dir)
         self.agent.set_data("cot_state", self.state)
     
+    def get_remote_work_dir(self) -> str | None:
+        # the agent's working directory inside the container, when it is a subfolder of a bind mounted volume (session folders)
+        if not self.agent.config.code_exec_docker_enabled: return None
+        for host_path, volume in self.agent.config.code_exec_docker_volumes.items():
+            relative = os.path.relpath(self.agent.context.work_dir, host_path)
+            if relative != "." and not relative.startswith(".."): return posixpath.join(volume["bind"], *relative.split(os.sep))
+        return None
+
+    def change_directory(self, shell, path: str):
+        shell.send_command(f"mkdir -p {shlex.quote(path)} && cd {shlex.quote(path)}")
+        idle = 0
+        while idle < 5: # drain the echo, so it is not part of the first command output
+            time.sleep(0.1)
+            _, partial_output = shell.read_output()
+            idle = 0 if partial_output else idle + 1
+
     def execute_python_code(self, code):
         escaped_code = shlex.quote(code)
         command = f'python3 -c {escaped_code}'
@@ -81,7 +101,7 @@ class CodeExecution(Tool):
 
     def terminal_session(self, command):
 
-        if self.agent.handle_intervention(): return ""  # wait for intervention and handle it, if paused
+        if self.agent.wait_if_paused(): return ""  # wait if paused, the agent handles the intervention
        
         self.state.shell.send_command(command)
 
@@ -89,12 +109,20 @@ class CodeExecution(Tool):
         return self.get_terminal_output()
 
     def get_terminal_output(self):
+        with trace.span("shell_read", self.agent) as span:
+            full_output = self.read_terminal_output(span)
+            span["output_bytes"] = trace.text_bytes(full_output)
+            return full_output
+
+    def read_terminal_output(self, span: dict):
         idle=0
+        span["reads"] = 0
         while True:       
             time.sleep(0.1)  # Wait for some output to be generated
             full_output, partial_output = self.state.shell.read_output()
+            span["reads"] += 1
 
-            if self.agent.handle_intervention(): return full_output  # wait for intervention and handle it, if paused
+            if self.agent.wait_if_paused(): return full_output  # wait if paused, the agent handles the intervention
         
             if partial_output:
                 PrintStyle(font_color="#85C1E9").stream(partial_output)
@@ -5,40 +5,43 @@ from python.helpers import perplexity_search
 from python.helpers import duckduckgo_search
 
 from . import memory_tool
-import concurrent.futures
+import asyncio
 
 from python.helpers.tool import Tool, Response
 from python.helpers import files
 from python.helpers.print_style import PrintStyle
 
 class Knowledge(Tool):
+
+    speculative = True
+
     def execute(self, question="", **kwargs):
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            # Schedule the two functions to be run in parallel
+        return asyncio.run(self.aexecute(question, **kwargs))
+
+    async def aexecute(self, question="", **kwargs):
+        # Schedule the searches to be run in parallel, each blocking client in its own worker thread
 
-            # perplexity search, if API provided
-            if os.getenv("API_KEY_PERPLEXITY"):
-                perplexity = executor.submit(perplexity_search.perplexity_search, question)
-            else: 
-                PrintStyle.hint("No API key provided for Perplexity. Skipping Perplexity search.")
-                perplexity = None
-                
+        # perplexity search, if API provided
+        if os.getenv("API_KEY_PERPLEXITY"):
+            perplexity = asyncio.to_thread(perplexity_search.perplexity_search, question)
+        else: 
+            PrintStyle.hint("No API key provided for Perplexity. Skipping Perplexity search.")
+            perplexity = asyncio.sleep(0, result="")
 
-            # duckduckgo search
-            duckduckgo = executor.submit(duckduckgo_search.search, question)
+        # duckduckgo search
+        duckduckgo = asyncio.to_thread(duckduckgo_search.search, question)
 
-            # memory search
-            future_memory = executor.submit(memory_tool.search, self.agent, question)
+        # memory search
+        future_memory = asyncio.to_thread(memory_tool.search, self.agent, question)
 
-            # Wait for both functions to complete
-            perplexity_result = (perplexity.result() if perplexity else "") or ""
-            duckduckgo_result = duckduckgo.result()
-            memory_result = future_memory.result()
+        # Wait for all searches to complete
+        perplexity_result, duckduckgo_result, memory_result = await asyncio.gather(perplexity, duckduckgo, future_memory)
+        perplexity_result = perplexity_result or ""
 
         msg = files.read_file("prompts/tool.knowledge.response.md", 
                               online_sources = perplexity_result + "\n\n" + str(duckduckgo_result),
                               memory = memory_result )
 
-        if self.agent.handle_intervention(msg): pass # wait for intervention and handle it, if paused
+        await self.agent.await_if_paused() # runs speculatively, the agent handles the intervention
 
         return Response(message=msg, break_loop=False)
\ No newline at end of file
@@ -2,13 +2,13 @@ import re
 from agent import Agent
 from python.helpers.vector_db import VectorDB, Document
 from python.helpers import files
-import os, json
+import os, json, threading
 from python.helpers.tool import Tool, Response
 from python.helpers.print_style import PrintStyle
 from chromadb.errors import InvalidDimensionException
 
-# TODO multiple DBs at once
-db: VectorDB | None= None
+dbs: dict[str, VectorDB] = {} # one database per memory subdir
+dbs_lock = threading.Lock()
 
 class Memory(Tool):
     def execute(self,**kwargs):
@@ -34,32 +34,37 @@ class Memory(Tool):
         return Response(message=result, break_loop=False)
             
 def search(agent:Agent, query:str, count:int=5, threshold:float=0.1):
-    initialize(agent)
-    docs = db.search_similarity_threshold(query,count,threshold) # type: ignore
+    docs = search_documents(agent, query, count, threshold)
     if len(docs)==0: return files.read_file("./prompts/fw.memories_not_found.md", query=query)
     else: return str(docs)
 
+def search_documents(agent:Agent, query:str, count:int=5, threshold:float=0.1) -> list[Document]:
+    db = initialize(agent)
+    return db.search_similarity_threshold(query,count,threshold)
+
 def save(agent:Agent, text:str):
-    initialize(agent)
-    id = db.insert_document(text) # type: ignore
+    db = initialize(agent)
+    id = db.insert_document(text)
     return files.read_file("./prompts/fw.memory_saved.md", memory_id=id)
 
 def delete(agent:Agent, ids_str:str):
-    initialize(agent)
+    db = initialize(agent)
     ids = extract_guids(ids_str)
-    deleted = db.delete_documents_by_ids(ids) # type: ignore
+    deleted = db.delete_documents_by_ids(ids)
     return files.read_file("./prompts/fw.memories_deleted.md", memory_count=deleted)    
 
 def forget(agent:Agent, query:str):
-    initialize(agent)
-    deleted = db.delete_documents_by_query(query) # type: ignore
+    db = initialize(agent)
+    deleted = db.delete_documents_by_query(query)
     return files.read_file("./prompts/fw.memories_deleted.md", memory_count=deleted)
 
-def initialize(agent:Agent):
-    global db
-    if not db:
-        dir = os.path.join("memory",agent.config.memory_subdir)
-        db = VectorDB(embeddings_model=agent.config.embeddings_model, in_memory=False, cache_dir=dir)
+def initialize(agent:Agent) -> VectorDB:
+    subdir = agent.config.memory_subdir
+    with dbs_lock: # sessions can recall from worker threads at the same time
+        if subdir not in dbs:
+            dir = os.path.join("memory",subdir)
+            dbs[subdir] = VectorDB(embeddings_model=agent.config.embeddings_model, in_memory=False, cache_dir=dir)
+        return dbs[subdir]
 
 def extract_guids(text):
     pattern = r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[1-5][0-9a-fA-F]{3}-[89abAB][0-9a-fA-F]{3}-[0-9a-fA-F]{12}\b'
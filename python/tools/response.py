@@ -9,6 +9,8 @@ from python.helpers.print_style import PrintStyle
 
 class ResponseTool(Tool):
 
+    final = True
+
     def execute(self,**kwargs):
         self.agent.set_data("timeout", self.agent.config.response_timeout_seconds)
         return Response(message=self.args["text"], break_loop=True)
@@ -9,6 +9,8 @@ from python.helpers.print_style import PrintStyle
 
 class TaskDone(Tool):
 
+    final = True
+
     def execute(self,**kwargs):
         self.agent.set_data("timeout", 0)
         return Response(message=self.args["text"], break_loop=True)
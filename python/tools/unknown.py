@@ -6,6 +6,6 @@ class Unknown(Tool):
         return Response(
                 message=files.read_file("prompts/fw.tool_not_found.md",
                                         tool_name=self.name,
-                                        tools_prompt=files.read_file("prompts/agent.tools.md")), 
+                                        tools_prompt=self.agent.tools_prompt), 
                 break_loop=False)
 
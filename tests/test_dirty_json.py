@@ -0,0 +1,26 @@
+from python.helpers.dirty_json import DirtyJson
+
+
+def test_key_after_opening_brace():
+    assert DirtyJson.parse_string('{"abc": 1}') == {"abc": 1}
+    assert DirtyJson.parse_string("{abc: 1}") == {"abc": 1}
+
+def test_double_braces():
+    assert DirtyJson.parse_string('{{"a": 1}}') == {"a": 1}
+    assert DirtyJson.parse_string('{{"a": {"b": 1}}}') == {"a": {"b": 1}}
+
+def test_nested_objects_close_once():
+    assert DirtyJson.parse_string('{"a": {"b": {"c": 1}}, "d": 2}') == {"a": {"b": {"c": 1}}, "d": 2}
+
+def test_quote_characters():
+    assert DirtyJson.parse_string("""{'a': 'x "}" y', "b": "it's", "c": `z ' }`}""") == {"a": 'x "}" y', "b": "it's", "c": "z ' }"}
+
+def test_empty_string_is_not_multiline():
+    assert DirtyJson.parse_string('{"a": "", "b": 1}') == {"a": "", "b": 1}
+    assert DirtyJson.parse_string("{'a': '', 'b': 1}") == {"a": "", "b": 1}
+
+def test_multiline_string():
+    assert DirtyJson.parse_string("{'a': '''x ' }\ny''', 'b': 1}") == {"a": "x ' }\ny", "b": 1}
+
+def test_unclosed_object():
+    assert DirtyJson.parse_string('{"a": 1, "b": "tex') == {"a": 1, "b": "tex"}
@@ -0,0 +1,67 @@
+import json
+from python.helpers.extract_tools import ToolRequestStream, json_parse_dirty, get_tool_requests
+
+
+def stream(text: str, chunk_size: int = 1) -> tuple[ToolRequestStream, list[list[dict]]]:
+    # feeds the text in chunks and records the ready requests after each one
+    tool_stream = ToolRequestStream()
+    snapshots = []
+    for i in range(0, len(text), chunk_size):
+        snapshots.append([dict(request) for request in tool_stream.feed(text[i:i+chunk_size])])
+    return tool_stream, snapshots
+
+
+def test_single_quoted_brace_does_not_close_args():
+    text = "{'thoughts':['x'],'tool_name':'code_execution_tool','tool_args':{'runtime':'terminal','code':'echo }; rm -rf build'}}"
+    tool_stream, snapshots = stream(text)
+    for requests in snapshots:
+        for request in requests: assert request["tool_args"]["code"] == "echo }; rm -rf build" # never reported truncated
+    assert tool_stream.tool_requests == [{"tool_name": "code_execution_tool", "tool_args": {"runtime": "terminal", "code": "echo }; rm -rf build"}}]
+    assert tool_stream.closed
+
+def test_backtick_brace_does_not_close_args():
+    text = '{"tool_name": "code_execution_tool", "tool_args": {"code": `echo "}" }`}}'
+    tool_stream, snapshots = stream(text)
+    assert all(request["tool_args"]["code"] == 'echo "}" }' for requests in snapshots for request in requests)
+
+def test_quote_closes_only_on_opening_character():
+    text = """{"tool_name": "response", "tool_args": {"text": "it's a } brace", 'other': 'say "}" here'}}"""
+    tool_stream, _ = stream(text)
+    assert tool_stream.tool_requests[0]["tool_args"] == {"text": "it's a } brace", "other": 'say "}" here'}
+
+def test_escaped_quote():
+    text = json.dumps({"tool_name": "response", "tool_args": {"text": 'a \\" } b'}})
+    tool_stream, _ = stream(text)
+    assert tool_stream.tool_requests[0]["tool_args"] == {"text": 'a \\" } b'}
+
+def test_multiline_string():
+    text = "{'tool_name': 'response', 'tool_args': {'text': '''it's } done'''}}"
+    for chunk_size in (1, 2, 3, 7):
+        tool_stream, _ = stream(text, chunk_size)
+        assert tool_stream.tool_requests[0]["tool_args"] == {"text": "it's } done"}
+
+def test_reported_before_object_closes():
+    text = json.dumps({"thoughts": ["x"], "tool_name": "code_execution_tool", "tool_args": {"runtime": "terminal", "code": "echo }"}, "extra": "filler"})
+    tool_stream, snapshots = stream(text)
+    ready_at = next(i for i, requests in enumerate(snapshots) if requests)
+    assert ready_at < text.index('"extra"') # reported once tool_args closed
+    assert snapshots[ready_at] == [{"tool_name": "code_execution_tool", "tool_args": {"runtime": "terminal", "code": "echo }"}}]
+
+def test_tool_calls_reported_one_by_one():
+    calls = [{"tool_name": "knowledge_tool", "tool_args": {"question": "a}"}}, {"tool_name": "memory_tool", "tool_args": {"query": "b"}}]
+    text = json.dumps({"thoughts": ["x"], "tool_calls": calls})
+    tool_stream, snapshots = stream(text)
+    first = next(i for i, requests in enumerate(snapshots) if requests)
+    assert snapshots[first] == calls[:1]
+    assert tool_stream.tool_requests == calls
+
+def test_text_before_object_and_empty_string():
+    text = 'Sure, here is the call: {"tool_name": "response", "tool_args": {"text": ""}} and some filler'
+    tool_stream, _ = stream(text)
+    assert tool_stream.tool_requests == [{"tool_name": "response", "tool_args": {"text": ""}}]
+    assert text[tool_stream.start:tool_stream.end] == '{"tool_name": "response", "tool_args": {"text": ""}}'
+
+def test_final_parse_matches_stream():
+    text = "{'tool_name':'code_execution_tool','tool_args':{'runtime':'terminal','code':'echo }; rm -rf build'}}"
+    tool_stream, _ = stream(text)
+    assert get_tool_requests(json_parse_dirty(text)) == tool_stream.tool_requests
@@ -0,0 +1,16 @@
+import pytest
+from python.helpers import checkpoint
+from python.helpers.session_host import valid_id
+
+
+@pytest.mark.parametrize("id", ["abc", "A-b_9", "c5059ba9-00bb-48b2-ae95-05d3394d6a44", "x" * 64])
+def test_valid_ids(id):
+    assert valid_id(id)
+
+@pytest.mark.parametrize("id", ["", "../escape", "../../../../tmp/rv/escape", "a/b", "a.b", ".", "x" * 65, "a\\b", "a b", "a\n"])
+def test_invalid_ids(id):
+    assert not valid_id(id)
+
+@pytest.mark.parametrize("id", ["", "../escape", "/tmp/x", ".hidden"])
+def test_checkpoint_path_rejects_other_folders(id):
+    with pytest.raises(ValueError): checkpoint.get_path(id)